@@ -0,0 +1,360 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# benchmark.py : benchmark of the whole pipeline
+#
+# Generates a synthetic corpus in the schema of
+# test_data.xml (<recipe><ti><in>...<pr>) and a matching
+# food dictionary, then times each stage separately:
+#   parse     : Parser.generate on the XML
+#   points    : Recommender creation and create_points
+#   index     : build_index
+#   recommend : get_recommendation, one query at a time
+#   batch     : get_recommendations, all the queries at once
+#   kmeans    : Clustering.kmeans (numpy engine)
+#   import *  : cold import of each entry point module, in
+#               a new interpreter (with --imports)
+# Every seed is fixed, so two runs of the same size do the
+# same work. The results are written as JSON and can be
+# compared with a stored baseline to flag regressions:
+#
+#   python benchmark.py -n 10000 -o results.json
+#   python benchmark.py -n 10000 --baseline results.json
+#
+# When the parser cannot run (e.g. the TextBlob corpora
+# are missing) the later stages use the generated recipes.
+# config "source" records which recipes were used, and
+# results of different sources are not compared.
+#
+######################################################
+
+# Python Modules
+import os
+import sys
+import json
+import random
+import argparse
+import resource
+import platform
+import tempfile
+import subprocess
+from timeit import default_timer
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from recipe import Recipe
+from ingredient import Ingredient
+
+# Entry point modules timed by --imports, and the heavy
+# libraries that each of them should not load
+ENTRY_POINTS  = ["recipe_recommender", "clustering", "corpus_cache", "recipe_parser"]
+HEAVY_MODULES = ["textblob", "nltk", "kdtree"]
+
+# Units as written in the XML, and as the parser reads them
+UNITS   = [("c", "cup"), ("tb", "tbsp"), ("ts", "tsp"), ("lb", "lb"), ("oz", "oz"),
+           ("ea", "each"), ("cn", "can"), ("pinch", "pinch"), ("qt", "qt"), ("pt", "pt")]
+AMOUNTS = [("1", 1.0), ("2", 2.0), ("3", 3.0), ("1/2", 0.5), ("1/4", 0.25), ("3/4", 0.75), ("1/3", 1.0 / 3)]
+FORMATS = ["", "", "chopped", "melted", "sliced", "diced", "softened"]
+
+CONSONANTS = "bcdfgklmnprtvz"
+VOWELS     = "aeiou"
+ENDINGS    = "ou" # Words ending with them are never changed by singularize
+
+
+def _word(rng):
+	""" A pronounceable made up word, ending with an o or u so that the
+	    parser keeps it as it is """
+
+	syllables = [rng.choice(CONSONANTS) + rng.choice(VOWELS) for i in range(rng.randint(1, 3))]
+
+	return "".join(syllables) + rng.choice(CONSONANTS) + rng.choice(ENDINGS)
+
+
+def food_dictionary(size, seed=0):
+	""" size food concepts: single words and some two word concepts """
+
+	rng      = random.Random(seed)
+	concepts = []
+	seen     = set()
+
+	while len(concepts) < size:
+		concept = _word(rng)
+		if len(concepts) > 10 and rng.random() < 0.2:
+			concept = rng.choice(concepts).split(" ")[0] + " " + concept
+		if concept not in seen:
+			seen.add(concept)
+			concepts.append(concept)
+
+	return concepts
+
+
+def synthetic_recipes(n, dictionary, seed=0):
+	""" Yields (recipe xml, Recipe) pairs. The Recipe holds what the
+	    parser should read from the xml """
+
+	rng = random.Random(seed)
+
+	for i in range(n):
+		title = "recipe %d %s" % (i, _word(rng))
+		lines = []
+		ingredients = []
+
+		for concept in rng.sample(dictionary, min(rng.randint(3, 12), len(dictionary))):
+			amount, quantity = rng.choice(AMOUNTS)
+			written, unit    = rng.choice(UNITS)
+			format           = rng.choice(FORMATS)
+
+			line = "%s %s %s" % (amount, written, concept.title())
+			if format != "":
+				line += "; " + format
+
+			lines.append("<in>%s</in>" % escape(line))
+			ingredients.append(Ingredient(concept, unit, quantity, format, line.lower()))
+
+		process = " ".join(_word(rng) for w in range(rng.randint(20, 80))) + "."
+		xml     = "<recipe>\n<ti>%s</ti>\n%s\n<pr>%s</pr>\n</recipe>\n" % (escape(title), "\n".join(lines), escape(process))
+
+		yield xml, Recipe(title.lower(), ingredients, process.lower())
+
+
+def write_corpus(path, n, dictionary, seed=0):
+	""" Writes the XML corpus and returns the generated recipes """
+
+	recipes = []
+
+	with open(path, 'w') as f:
+		f.write("<recipes>\n")
+		for xml, recipe in synthetic_recipes(n, dictionary, seed):
+			f.write(xml)
+			recipes.append(recipe)
+		f.write("</recipes>\n")
+
+	return recipes
+
+
+def _rss_mb():
+	""" Current resident memory in MB (/proc on Linux, the peak otherwise) """
+
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * resource.getpagesize() / float(1 << 20)
+	except IOError:
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Stages:
+	""" Times and measures the memory of named stages """
+
+	def __init__(self, repeat=1):
+
+		self.repeat  = max(1, repeat)
+		self.results = OrderedDict()
+
+
+	def run(self, name, function, repeat=None):
+		""" Runs function repeat times, keeps the best time and returns its value """
+
+		before = _rss_mb()
+		best   = None
+
+		for i in range(self.repeat if repeat is None else repeat):
+			start   = default_timer()
+			value   = function()
+			elapsed = default_timer() - start
+			best    = elapsed if best is None else min(best, elapsed)
+
+		self.results[name] = {
+			"seconds"      : best,
+			"rss_mb"       : _rss_mb(),
+			"rss_delta_mb" : _rss_mb() - before
+		}
+
+		return value
+
+
+	def failed(self, name, error):
+		""" Records a stage that could not run """
+
+		message = [line for line in str(error).split("\n") if line.strip() != ""][:1]
+
+		self.results[name] = {"error": ": ".join([type(error).__name__] + message)}
+
+
+_IMPORT_SCRIPT = """
+import sys, json
+from timeit import default_timer
+start = default_timer()
+import %s
+print json.dumps([default_timer() - start, [m for m in %r if m in sys.modules]])
+"""
+
+
+def import_time(module, repeat=1):
+	""" Best time to import module in a new interpreter, and the heavy
+	    modules that the import loaded """
+
+	directory = os.path.dirname(os.path.abspath(__file__))
+	best      = None
+
+	for i in range(max(1, repeat)):
+		output = subprocess.check_output([sys.executable, "-c", _IMPORT_SCRIPT % (module, HEAVY_MODULES)], cwd=directory)
+		seconds, loaded = json.loads(output.strip().split("\n")[-1])
+		best = seconds if best is None else min(best, seconds)
+
+	return {"seconds": best, "loaded": loaded}
+
+
+def run_benchmark(n, vocab=500, queries=200, k=10, clusters=8, seed=0, repeat=1, workers=1, parse=True,
+                  imports=False):
+	""" Runs every stage on a synthetic corpus of n recipes, returns the results """
+
+	# The project code uses both random modules
+	random.seed(seed)
+	np.random.seed(seed)
+
+	from recipe_recommender import Recommender
+	from clustering import Clustering
+
+	stages     = Stages(repeat)
+
+	# Each import in a new interpreter, that has not loaded anything yet
+	if imports:
+		for module in ENTRY_POINTS:
+			try:
+				stages.results["import " + module] = import_time(module, repeat)
+			except Exception as e:
+				stages.failed("import " + module, e)
+
+	dictionary = food_dictionary(vocab, seed)
+	directory  = tempfile.mkdtemp(prefix="recipes_benchmark")
+	data_file  = os.path.join(directory, "corpus.xml")
+
+	try:
+		generated = stages.run("generate", lambda: write_corpus(data_file, n, dictionary, seed), repeat=1)
+		recipes   = generated
+		source    = "generated"
+
+		if parse:
+			try:
+				from recipe_parser import Parser
+				parser  = Parser(data_file, set(dictionary), stream=True)
+				recipes = stages.run("parse", lambda: parser.generate(workers), repeat=1)
+				source  = "parsed"
+			except Exception as e:
+				stages.failed("parse", e)
+				recipes = generated
+
+		rng  = random.Random(seed)
+		asks = [dict((c, float(1)) for c in rng.sample(dictionary, rng.randint(1, 4))) for i in range(queries)]
+
+		def points():
+			recommender = Recommender(recipes)
+			recommender.get_points()
+			return recommender
+
+		recommender = stages.run("points", points)
+		stages.run("index", recommender.build_index)
+		stages.run("recommend", lambda: [recommender.get_recommendation(ask, k) for ask in asks])
+		stages.run("batch", lambda: recommender.get_recommendations(asks, k))
+
+		def kmeans():
+			random.seed(seed) # Same initial means on every run
+			clustering = Clustering(recommender.get_points(), engine="numpy")
+			clustering.kmeans(clusters)
+			return clustering
+
+		stages.run("kmeans", kmeans)
+
+	finally:
+		if os.path.exists(data_file):
+			os.remove(data_file)
+		os.rmdir(directory)
+
+	return OrderedDict([
+		("config", OrderedDict([("recipes", n), ("vocab", vocab), ("queries", queries), ("k", k),
+		                        ("clusters", clusters), ("seed", seed), ("repeat", repeat), ("workers", workers),
+		                        ("source", source)])),
+		("python", platform.python_version()),
+		("numpy", np.__version__),
+		("peak_rss_mb", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0),
+		("stages", stages.results)
+	])
+
+
+def compare(results, baseline, tolerance=0.2):
+	""" Returns the (stage, baseline seconds, seconds) of the stages more
+	    than tolerance slower than in the baseline """
+
+	regressions = []
+
+	for name, stage in results["stages"].items():
+		before = baseline["stages"].get(name, {})
+		if "seconds" not in stage or "seconds" not in before:
+			continue
+		if stage["seconds"] > before["seconds"] * (1 + tolerance):
+			regressions.append((name, before["seconds"], stage["seconds"]))
+
+	return regressions
+
+
+def main(argv=None):
+
+	parser = argparse.ArgumentParser(description="Benchmark of the parse -> points -> recommend / cluster pipeline")
+	parser.add_argument("-n", "--recipes", type=int, default=1000, help="recipes in the corpus")
+	parser.add_argument("--vocab", type=int, default=500, help="food concepts in the dictionary")
+	parser.add_argument("--queries", type=int, default=200)
+	parser.add_argument("-k", type=int, default=10, help="recommendations per query")
+	parser.add_argument("--clusters", type=int, default=8)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--repeat", type=int, default=1, help="runs of each stage, the best time is kept")
+	parser.add_argument("--workers", type=int, default=1, help="parser processes")
+	parser.add_argument("--no-parse", dest="parse", action="store_false", help="skip the parser stage")
+	parser.add_argument("--imports", action="store_true", help="also time the cold import of the entry points")
+	parser.add_argument("-o", "--output", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="JSON results to compare with")
+	parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression")
+	args = parser.parse_args(argv)
+
+	results = run_benchmark(args.recipes, args.vocab, args.queries, args.k, args.clusters,
+	                        args.seed, args.repeat, args.workers, args.parse, args.imports)
+
+	text = json.dumps(results, indent=2)
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(text + "\n")
+	else:
+		print text
+
+	if args.baseline:
+		with open(args.baseline, 'r') as f:
+			baseline = json.load(f)
+
+		source = baseline.get("config", {}).get("source")
+		if source != results["config"]["source"]:
+			sys.stderr.write("error: the baseline ran on %s recipes, this run on %s recipes\n"
+			                 % (source, results["config"]["source"]))
+			return 2
+
+		if baseline.get("config") != results["config"]:
+			sys.stderr.write("warning: the baseline was run with another configuration\n")
+
+		regressions = compare(results, baseline, args.tolerance)
+		for name, before, now in regressions:
+			sys.stderr.write("regression: %s %.4fs -> %.4fs (%+.0f%%)\n" % (name, before, now, 100 * (now / before - 1)))
+
+		return 1 if len(regressions) > 0 else 0
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -16,31 +16,75 @@
 # 1. Picks a random point
 # 2. Succesively picks other k-1 points, as farthest from the
 #    previous ones
+# The "k-means++" and "k-means||" initializations sample the
+# means instead, proportionally to their distance to the
+# means already picked. With n_init > 1 k-means is restarted
+# with different seeds (in parallel processes) and the run
+# with the lowest objective is kept.
+#
+# The hierarchical clustering builds the whole dendrogram once
+# (see hierarchical.py), which can then be cut at any k.
+#
+# Two engines are available: "python" walks a kdtree of the
+# means for every point, "numpy" keeps the points in a dense
+# float array and runs each step as batched matrix operations
+#
+# The points are either a list of tuples or SparsePoints.
+# For SparsePoints the clusters hold point ids (rows) and
+# the numpy engine uses sparse dot products
 #
 ################################################################
 
 # Python Modules
 import math
 import random as rand
+import multiprocessing
 from collections import defaultdict
 
-# K-dtree Library Modules
-import kdtree
+# NumPy Modules
+import numpy as np
+
+# K-dtree Library Modules: only the python engine imports kdtree
+
+# Project Modules
+import instrumentation
+from sparse_points import SparsePoints, pairwise_sq_distances
+from hierarchical import linkage
+
+ENGINES = ("python", "numpy")
+INITS   = ("farthest", "k-means++", "k-means||")
+
+# Clustering of the restarts run in worker processes
+_restart_clustering = None
 
 class Clustering:
 	""" Clustering Algorithm """
 
-	def __init__(self, points):
+	def __init__(self, points, engine="python", init="farthest", n_init=1, workers=1):
+
+		if engine not in ENGINES:
+			raise ValueError("Unknown k-means engine: " + str(engine))
+		if init not in INITS:
+			raise ValueError("Unknown k-means initialization: " + str(init))
 
 		self.k        = 2
 		self.means    = []
 		self.points   = points
+		self.engine   = engine
+		self.init     = init
+		self.n_init   = n_init
+		self.workers  = workers
 		self.clusters = defaultdict(list)
+		self.history  = [] # Objective J of each k-means iteration
+
+		self.dendrogram = None
 
 
 	def _next_further_point(self, points, centroids):
 		""" Returns furthest point from centroids """
 
+		import kdtree
+
 		tree = kdtree.create(centroids)
 		#dic  = {}
 		
@@ -87,6 +131,8 @@ class Clustering:
 	def _assign_points(self):
 		""" Assign points to the closest cluster """
 
+		import kdtree
+
 		tree     = kdtree.create(self.means[:])
 		clusters = defaultdict(list)
 
@@ -178,28 +224,374 @@ class Clustering:
 		return 0
 
 
+	def _sparse_inertia(self, clusters):
+		""" Inertia of clusters of SparsePoints ids, in one pass over the values """
+
+		X      = self.points
+		means  = list(clusters.keys())
+		M      = np.asarray(means, dtype=float)
+		labels = np.zeros(len(X), dtype=np.int64)
+		for c, mean in enumerate(means):
+			labels[clusters[mean]] = c
+
+		# |x - m|^2 = |x|^2 - 2 x.m + |m|^2, only with the mean of x
+		rows = X.row_ids()
+		dots = np.bincount(rows, weights=X.data * M[labels[rows], X.indices], minlength=len(X))
+		dist = X.sq_norms() - 2.0 * dots + (M * M).sum(axis=1)[labels]
+		np.maximum(dist, 0.0, out=dist)
+
+		inertia = np.bincount(labels, weights=dist, minlength=len(means))
+
+		return dict(zip(means, inertia.tolist()))
+
+
+	def _inertia(self, clusters):
+		""" Sum of squared distances of the points of each cluster to its mean """
+
+		if isinstance(self.points, SparsePoints):
+			return self._sparse_inertia(clusters)
+
+		inertia = {}
+
+		for mean, cluster in clusters.items():
+			inertia[mean] = 0
+			for point in cluster:
+				inertia[mean] += sum([math.pow(x-y,2.0) for x,y in zip(point, mean)])
+
+		return inertia
+
+
+	def cluster_inertia(self):
+		""" Returns a dictionary with the inertia of each cluster mean """
+
+		return self._inertia(self.clusters)
+
+
 	def objective_function(self):
-		""" Returns the value of k-means objective function J """
+		""" Returns the value of k-means objective function J.
+		    Each point is only compared with the mean of its own cluster """
+
+		return sum(self.cluster_inertia().values())
+
+
+	def elbow(self, ks):
+		""" Runs k-means for each k in ks and returns (best k, {k: J}).
+		    The best k is the elbow: the point of the J curve farthest
+		    from the line between its first and last points """
+
+		ks         = sorted(ks)
+		objectives = {}
+		for k in ks:
+			self.kmeans(k)
+			objectives[k] = self.objective_function()
+
+		if len(ks) < 3:
+			return ks[-1], objectives
+
+		# Normalize both axes before measuring the distance to the line
+		x  = [float(k - ks[0]) / (ks[-1] - ks[0]) for k in ks]
+		J  = [objectives[k] for k in ks]
+		dJ = (J[0] - J[-1]) or 1.0
+		y  = [(j - J[-1]) / dJ for j in J]
+
+		# Line from (0, 1) to (1, 0): distance is proportional to |x + y - 1|
+		best = max(range(len(ks)), key=lambda i: abs(x[i] + y[i] - 1.0))
+
+		return ks[best], objectives
+
+
+	def _sq_distances(self, X, sq_norms, means):
+		""" Squared distance from every row of X to every mean (N x k) """
+
+		return pairwise_sq_distances(X, means, sq_norms)
+
+
+	def _initial_means_numpy(self, X, sq_norms):
+		""" Same farthest point initialization as _initial_means,
+		    keeping the summed distance to the centroids as an array """
+
+		n      = len(sq_norms)
+		chosen = np.zeros(n, dtype=bool)
+
+		# Pick a random point
+		i = rand.randrange(n)
+		chosen[i]  = True
+		centroids  = [i]
+		total_dist = np.zeros(n)
+
+		# Pick k-1 points as farthest as previous
+		for c in range(1, self.k):
+			total_dist += self._sq_distances(X, sq_norms, self._rows(X, centroids[-1:]))[:, 0]
+			candidates  = np.where(chosen, -1.0, total_dist)
+			i = int(np.argmax(candidates))
+			chosen[i] = True
+			centroids.append(i)
+
+		return self._rows(X, centroids)
+
+
+	def _weighted_choice(self, rng, weights):
+		""" Index picked with probability proportional to its weight """
+
+		cumulative = np.cumsum(weights)
+		i = int(np.searchsorted(cumulative, rng.rand() * cumulative[-1], side="right"))
+
+		return min(i, len(cumulative) - 1)
+
+
+	def _kmeanspp_ids(self, X, sq_norms, rng, weights=None):
+		""" k-means++: each new mean is sampled proportionally to the
+		    (weighted) squared distance to the closest mean already picked """
+
+		n = len(sq_norms)
+		if weights is None:
+			weights = np.ones(n)
+
+		ids     = [self._weighted_choice(rng, weights)]
+		closest = self._sq_distances(X, sq_norms, self._rows(X, ids))[:, 0]
+
+		for c in range(1, self.k):
+			p = weights * closest
+			if p.sum() <= 0: # Less distinct points than means
+				i = int(rng.randint(n))
+			else:
+				i = self._weighted_choice(rng, p)
+			ids.append(i)
+
+			# Only the distance to the new mean has to be computed
+			closest = np.minimum(closest, self._sq_distances(X, sq_norms, self._rows(X, [i]))[:, 0])
+
+		return ids
+
+
+	def _kmeans_parallel_ids(self, X, sq_norms, rng, rounds=5):
+		""" k-means||: a few rounds oversample about 2k candidates each,
+		    then k-means++ picks the means among the candidates weighted
+		    by the number of points closest to them """
+
+		n      = len(sq_norms)
+		l      = 2.0 * self.k
+		chosen = np.zeros(n, dtype=bool)
+
+		first = int(rng.randint(n))
+		chosen[first] = True
+		closest = self._sq_distances(X, sq_norms, self._rows(X, [first]))[:, 0]
+
+		for r in range(rounds):
+			cost = closest.sum()
+			if cost <= 0:
+				break
+
+			new = np.where(~chosen & (rng.rand(n) < l * closest / cost))[0]
+			if len(new) == 0:
+				continue
+
+			chosen[new] = True
+			closest = np.minimum(closest, self._sq_distances(X, sq_norms, self._rows(X, new)).min(axis=1))
+
+		candidates = np.where(chosen)[0]
+		if len(candidates) <= self.k:
+			return self._kmeanspp_ids(X, sq_norms, rng)
+
+		C       = self._rows(X, candidates)
+		labels  = np.argmin(self._sq_distances(X, sq_norms, C), axis=1)
+		weights = np.bincount(labels, minlength=len(candidates)).astype(float)
+		picked  = self._kmeanspp_ids(C, (C * C).sum(axis=1), rng, weights)
+
+		return [int(candidates[i]) for i in picked]
+
+
+	def _seed_ids(self, X, sq_norms):
+		""" Ids of the initial means for the k-means++ and k-means|| initializations """
+
+		# Seeded from random, so rand.seed makes the run reproducible
+		rng = np.random.RandomState(rand.randrange(1 << 30))
+
+		if self.init == "k-means||":
+			return self._kmeans_parallel_ids(X, sq_norms, rng)
+
+		return self._kmeanspp_ids(X, sq_norms, rng)
+
+
+	def _rows(self, X, ids):
+		""" Dense copy of the given rows of X """
 
-		J = 0
+		if isinstance(X, SparsePoints):
+			return X.dense_rows(ids)
 
-		for mean in self.clusters.keys():
-			for point in self.points:
-				i = self._is_member(point,mean)
-				d = [math.pow(x-y,2.0) for x,y in zip(point, mean)]
-				s = [i*x for x in d]
-				J += sum(s)
+		return X[ids].copy()
 
-		return J
+
+	def _update_means_numpy(self, X, labels, means):
+		""" Mean of the points assigned to each cluster.
+		    An empty cluster keeps its previous mean """
+
+		k      = means.shape[0]
+		counts = np.bincount(labels, minlength=k).astype(float)
+
+		if isinstance(X, SparsePoints):
+			sums = X.sum_by_label(labels, k)
+		else:
+			sums = np.zeros_like(means)
+			np.add.at(sums, labels, X)
+
+		new_means = means.copy()
+		non_empty = counts > 0
+		new_means[non_empty] = sums[non_empty] / counts[non_empty][:, None]
+
+		return new_means
+
+
+	def _kmeans_numpy(self, threshold):
+		""" k-means over a dense float array of the points """
+
+		if isinstance(self.points, SparsePoints):
+			X        = self.points
+			sq_norms = X.sq_norms()
+			members  = range(len(X))
+		else:
+			X        = np.asarray(self.points, dtype=float)
+			sq_norms = (X * X).sum(axis=1)
+			members  = self.points
+
+		if self.init == "farthest":
+			means = self._initial_means_numpy(X, sq_norms)
+		else:
+			means = self._rows(X, self._seed_ids(X, sq_norms))
+
+		# Continue until convergence
+		converged = False
+		while not converged:
+
+			# Assign each point to the closest cluster
+			dist    = self._sq_distances(X, sq_norms, means)
+			labels  = np.argmin(dist, axis=1)
+			closest = dist[np.arange(len(labels)), labels]
+			self.history.append(float(closest.sum()))
+
+			instrumentation.count("kmeans.iterations")
+			instrumentation.count("kmeans.distance_evaluations", dist.size)
+
+			# Update means and check if we reached convergence
+			new_means = self._update_means_numpy(X, labels, means)
+			shift     = np.sqrt(((new_means - means) ** 2).sum(axis=1))
+			converged = bool((shift <= threshold).all())
+
+			if not converged:
+				means = new_means
+
+		# Same structure as the python engine: mean -> list of points
+		self.means    = [tuple(m) for m in means.tolist()]
+		self.clusters = defaultdict(list)
+		for point, label in zip(members, labels.tolist()):
+			self.clusters[self.means[label]].append(point)
+
+		return self.clusters
+
+
+	def _kmeans_sparse_python(self):
+		""" Runs the python engine on dense tuples of the SparsePoints
+		    and maps the clusters back to point ids """
+
+		sparse      = self.points
+		self.points = [tuple(p) for p in sparse.to_dense().tolist()]
+
+		ids = defaultdict(list)
+		for i, point in enumerate(self.points):
+			ids[point].append(i)
+
+		try:
+			clusters = self._kmeans_once()
+		finally:
+			self.points = sparse
+
+		self.clusters = defaultdict(list)
+		for mean, cluster in clusters.items():
+			for point in cluster:
+				self.clusters[mean].append(ids[point].pop(0))
+
+		return self.clusters
+
+
+	def _initial_means_python(self):
+		""" Initial means of the python engine """
+
+		if self.init == "farthest":
+			return self._initial_means()
+
+		X = np.asarray(self.points, dtype=float)
+
+		return [self.points[i] for i in self._seed_ids(X, (X * X).sum(axis=1))]
+
+
+	def _kmeans_restart(self, seed):
+		""" One seeded k-means run: (J, clusters, means, history).
+		    The initializations draw from random, which is seeded for the
+		    run and then restored, so the caller's random state goes on """
+
+		state = rand.getstate()
+		rand.seed(seed)
+		try:
+			self._kmeans_once()
+		finally:
+			rand.setstate(state)
+
+		return (self.objective_function(), self.clusters, self.means, self.history)
 
 
 	def kmeans(self, number_of_clusters):
 		""" Implementation of k-means algorithm """
 
+		with instrumentation.timer("kmeans"):
+			return self._kmeans(number_of_clusters)
+
+
+	def _kmeans(self, number_of_clusters):
+		""" k-means, keeping the best of n_init runs """
+
 		self.k = number_of_clusters
 
+		if self.n_init <= 1:
+			return self._kmeans_once()
+
+		global _restart_clustering
+
+		seeds = [rand.randrange(1 << 30) for i in range(self.n_init)]
+
+		if self.workers > 1:
+			# Forked workers inherit the points instead of receiving a copy
+			_restart_clustering = self
+			pool = multiprocessing.Pool(self.workers)
+			try:
+				runs = pool.map(_kmeans_restart, seeds)
+			finally:
+				pool.terminate()
+				_restart_clustering = None
+		else:
+			runs = [self._kmeans_restart(seed) for seed in seeds]
+
+		# Keep the run with the lowest objective
+		J, clusters, means, history = min(runs, key=lambda run: run[0])
+		self.clusters = clusters
+		self.means    = means
+		self.history  = history
+
+		return self.clusters
+
+
+	def _kmeans_once(self):
+		""" One k-means run from the configured initialization """
+
+		self.history = []
+
+		if self.engine == "numpy":
+			return self._kmeans_numpy(0.01)
+
+		if isinstance(self.points, SparsePoints):
+			return self._kmeans_sparse_python()
+
 		# Initialize means
-		self.means = self._initial_means()
+		self.means = self._initial_means_python()
 		clusters   = defaultdict(list)
 
 		# print self.means
@@ -212,6 +604,10 @@ class Clustering:
 			# Assign each point to the closest cluster
 			clusters = defaultdict(list)
 			clusters = self._assign_points()
+			self.history.append(sum(self._inertia(clusters).values()))
+
+			instrumentation.count("kmeans.iterations")
+			instrumentation.count("kmeans.distance_evaluations", len(self.points) * len(self.means))
 
 			# print "Current clusters"
 			# print clusters.values()
@@ -239,3 +635,45 @@ class Clustering:
 
 		return self.clusters
 
+
+
+	def hierarchical(self, method="average"):
+		""" Agglomerative clustering with the given linkage
+		    (single, complete, average or ward). Returns the dendrogram """
+
+		self.dendrogram = linkage(self.points, method)
+
+		return self.dendrogram
+
+
+	def cut(self, number_of_clusters):
+		""" Cuts the dendrogram of hierarchical into clusters,
+		    with the same mean -> points structure as kmeans """
+
+		self.k = number_of_clusters
+		labels = self.dendrogram.cut(number_of_clusters)
+		k      = int(labels.max()) + 1 if len(labels) > 0 else 0
+
+		if isinstance(self.points, SparsePoints):
+			counts  = np.bincount(labels, minlength=k).astype(float)
+			means   = self.points.sum_by_label(labels, k) / counts[:, None]
+			members = range(len(self.points))
+		else:
+			groups = defaultdict(list)
+			for point, label in zip(self.points, labels.tolist()):
+				groups[label].append(point)
+			means   = [self._calculate_mean(groups[c]) for c in range(k)]
+			members = self.points
+
+		self.means    = [tuple(m) for m in np.asarray(means).tolist()]
+		self.clusters = defaultdict(list)
+		for point, label in zip(members, labels.tolist()):
+			self.clusters[self.means[label]].append(point)
+
+		return self.clusters
+
+
+def _kmeans_restart(seed):
+	""" Runs one k-means restart in a worker process """
+
+	return _restart_clustering._kmeans_restart(seed)
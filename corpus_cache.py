@@ -0,0 +1,108 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# corpus_cache.py : binary cache of a parsed corpus
+#
+# Parsing the XML and running the NLP on every
+# ingredient is by far the slowest part of a run. The
+# corpus cache is a directory with:
+#   key          : hash of the XML and the food dictionary
+#   recipes.pkl  : the parsed recipes and the ingredients
+#                  (dimension order and max quantities)
+#   *.npy        : the CSR points (SparsePoints.save)
+# The points are loaded with memory mapping, and the
+# cache is ignored as soon as the XML or the dictionary
+# change.
+#
+######################################################
+
+# Python Modules
+import os
+import hashlib
+import cPickle as pickle
+
+# Project Modules
+from sparse_points import SparsePoints
+from recipe_recommender import Recommender
+
+# Bump when the layout of the cache changes
+FORMAT_VERSION = "4"
+
+
+def corpus_key(data_file, dictionary):
+	""" Hash of the XML file and the food dictionary """
+
+	h = hashlib.sha1(FORMAT_VERSION)
+
+	with open(data_file, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b""):
+			h.update(block)
+
+	for concept in sorted(dictionary):
+		h.update(b"\0")
+		h.update(concept.encode("utf-8") if isinstance(concept, unicode) else concept)
+
+	return h.hexdigest()
+
+
+def save_corpus(path, key, recommender):
+	""" Writes the recipes, ingredients and points of the recommender """
+
+	if not os.path.isdir(path):
+		os.makedirs(path)
+
+	# Invalidate first, so a partial write is never taken as valid
+	key_file = os.path.join(path, "key")
+	if os.path.exists(key_file):
+		os.remove(key_file)
+
+	corpus = (recommender.recipes, recommender.ingredients_dic, recommender.ingredients)
+	with open(os.path.join(path, "recipes.pkl"), 'wb') as f:
+		pickle.dump(corpus, f, pickle.HIGHEST_PROTOCOL)
+
+	recommender.get_points().save(path)
+
+	with open(key_file, 'w') as f:
+		f.write(key)
+
+
+def load_corpus(path, key):
+	""" Returns a Recommender from the cache, or None if it is not valid for key """
+
+	try:
+		with open(os.path.join(path, "key"), 'r') as f:
+			if f.read() != key:
+				return None
+	except IOError:
+		return None
+
+	with open(os.path.join(path, "recipes.pkl"), 'rb') as f:
+		recipes, ingredients_dic, ingredients = pickle.load(f)
+
+	points = SparsePoints.load(path, len(ingredients))
+
+	return Recommender(recipes, ingredients_dic, ingredients, points)
+
+
+def load_or_build(path, data_file, dictionary, workers=1):
+	""" Returns the Recommender of data_file, from the cache when it is
+	    valid, parsing the XML (with workers processes) and refreshing
+	    the cache otherwise """
+
+	key         = corpus_key(data_file, dictionary)
+	recommender = load_corpus(path, key)
+
+	if recommender is None:
+		from recipe_parser import Parser # Not needed to load a valid cache
+
+		parser      = Parser(data_file, dictionary, stream=True)
+		recommender = Recommender(parser.generate(workers))
+		parser.close()
+		save_corpus(path, key, recommender)
+
+	return recommender
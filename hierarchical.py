@@ -0,0 +1,210 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# hierarchical.py : agglomerative clustering
+#
+# linkage builds the dendrogram of the points with the
+# nearest neighbour chain algorithm: it follows a chain of
+# nearest neighbours until two clusters are each other's
+# nearest neighbour, merges them and updates their
+# distances with the Lance-Williams formula. It needs
+# O(N^2) time and one condensed distance matrix of
+# N(N-1)/2 values. The Dendrogram keeps the N-1 merges and
+# can be cut at any number of clusters afterwards.
+#
+# Linkages: single, complete, average and ward.
+#
+######################################################
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from sparse_points import SparsePoints
+
+LINKAGES = ("single", "complete", "average", "ward")
+
+
+class Dendrogram:
+	""" Merges of an agglomerative clustering """
+
+	def __init__(self, n, merges):
+		""" merges[i] = (a, b, height, size) creates cluster n + i from
+		    clusters a and b; clusters 0..n-1 are the points """
+
+		self.n      = n
+		self.merges = merges
+
+
+	def __len__(self):
+
+		return len(self.merges)
+
+
+	def cut(self, k):
+		""" Returns the cluster label (0..k-1) of every point
+		    when the dendrogram is cut into k clusters """
+
+		k      = max(1, min(k, self.n))
+		if self.n == 0:
+			return np.zeros(0, dtype=int)
+
+		parent = np.arange(2 * self.n - 1)
+
+		def find(c):
+			while parent[c] != c:
+				parent[c] = parent[parent[c]]
+				c = parent[c]
+			return c
+
+		# Apply the n-k lowest merges
+		for i in range(self.n - k):
+			a, b, height, size = self.merges[i]
+			parent[find(a)] = self.n + i
+			parent[find(b)] = self.n + i
+
+		roots  = [find(p) for p in range(self.n)]
+		labels = {}
+		for root in roots:
+			labels.setdefault(root, len(labels))
+
+		return np.array([labels[root] for root in roots])
+
+
+	def heights(self):
+		""" Height of each merge, in increasing order """
+
+		return [m[2] for m in self.merges]
+
+
+def _condensed_distances(points):
+	""" Euclidean distances of all pairs i < j, row by row """
+
+	if isinstance(points, SparsePoints):
+		sq_norms = points.sq_norms()
+		row      = lambda i: points.dot(points.dense_rows([i])[0])
+	else:
+		X = np.asarray(points, dtype=float)
+		if X.size == 0:
+			return np.zeros(0), len(X)
+		sq_norms = (X * X).sum(axis=1)
+		row      = lambda i: np.dot(X, X[i])
+
+	n = len(sq_norms)
+	D = np.empty(max(n * (n - 1) // 2, 0))
+
+	start = 0
+	for i in range(n - 1):
+		d = sq_norms[i] + sq_norms[i + 1:] - 2.0 * row(i)[i + 1:]
+		D[start:start + n - i - 1] = np.sqrt(np.maximum(d, 0.0))
+		start += n - i - 1
+
+	return D, n
+
+
+def _lance_williams(method, d_ka, d_kb, d_ab, n_a, n_b, n_k):
+	""" Distance from clusters k to the merge of a and b """
+
+	if method == "single":
+		return np.minimum(d_ka, d_kb)
+	if method == "complete":
+		return np.maximum(d_ka, d_kb)
+	if method == "average":
+		return (n_a * d_ka + n_b * d_kb) / (n_a + n_b)
+
+	# ward, on euclidean distances
+	t = n_a + n_b + n_k
+	d = ((n_a + n_k) * d_ka ** 2 + (n_b + n_k) * d_kb ** 2 - n_k * d_ab ** 2) / t
+
+	return np.sqrt(np.maximum(d, 0.0))
+
+
+def linkage(points, method="average"):
+	""" Builds the Dendrogram of the points (list of tuples, array or SparsePoints) """
+
+	if method not in LINKAGES:
+		raise ValueError("Unknown linkage: " + str(method))
+
+	D, n = _condensed_distances(points)
+
+	everyone = np.arange(n)
+	active   = np.ones(n, dtype=bool)
+	size     = np.ones(n)
+
+	def condensed(a, others):
+		""" Positions in D of the pairs (a, other) """
+		lo = np.minimum(a, others)
+		hi = np.maximum(a, others)
+		return n * lo - lo * (lo + 1) // 2 + (hi - lo - 1)
+
+	def distances(a):
+		""" Distances from a to every active cluster, inf for the others """
+		d = np.full(n, np.inf)
+		others = everyone[active & (everyone != a)]
+		d[others] = D[condensed(a, others)]
+		return d
+
+	merges = []
+	chain  = []
+	for step in range(n - 1):
+
+		if len(chain) == 0:
+			chain.append(int(np.argmax(active)))
+
+		# Follow the nearest neighbours until a reciprocal pair
+		while True:
+			a = chain[-1]
+			d = distances(a)
+			b = int(np.argmin(d))
+			if len(chain) > 1 and d[chain[-2]] <= d[b]:
+				b = chain[-2]
+				break
+			chain.append(b)
+
+		chain.pop()
+		chain.pop()
+		height = float(d[b])
+
+		# Merge a and b into b
+		others = everyone[active & (everyone != a) & (everyone != b)]
+		if len(others) > 0:
+			pos_a = condensed(a, others)
+			pos_b = condensed(b, others)
+			D[pos_b] = _lance_williams(method, D[pos_a], D[pos_b], height, size[a], size[b], size[others])
+
+		merges.append((a, b, height, size[a] + size[b]))
+		size[b] += size[a]
+		active[a] = False
+
+	return _relabel(n, merges)
+
+
+def _relabel(n, merges):
+	""" Sorts the merges by height and names the clusters as Dendrogram expects """
+
+	order = sorted(range(len(merges)), key=lambda i: merges[i][2])
+
+	# Slot of the chain algorithm -> current cluster id
+	cluster = list(range(n))
+	parent  = list(range(n))
+
+	def find(p):
+		while parent[p] != p:
+			parent[p] = parent[parent[p]]
+			p = parent[p]
+		return p
+
+	relabeled = []
+	for i in order:
+		a, b, height, size = merges[i]
+		ra, rb = find(a), find(b)
+		relabeled.append((cluster[ra], cluster[rb], height, int(size)))
+		parent[ra] = rb
+		cluster[rb] = n + len(relabeled) - 1
+
+	return Dendrogram(n, relabeled)
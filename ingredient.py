@@ -16,43 +16,71 @@
 
 # from product import Product
 
-class Ingredient:
+# Quantity of each unit in 1 cup (1 cup is 48 teaspoons (tsp)).
+# Shared by all the ingredients and by IngredientTable
+CONVERSIONS = {
+"cup":float(1.0),
+"can":float(1.0),
+"tsp":float(48.0),
+"tbsp":float(16.0),
+"lb":float(0.00779),
+"qt":float(0.25),
+"pt":float(0.5),
+"oz":float(8.0),
+"gal":float(0.0625),
+"gr":float(3.5437),
+"mg":float(3543.7),
+"kg":float(0.00354),
+"l":float(0.236),
+"ml":float(236.59),
+"pinch":float(768.0),
+"dash":float(384.0),
+"drop":float(2880.0),
+"touch":float(2000.0),
+"clove":float(96.0),
+"each":float(8)
+}
+
+def shared_string(s):
+	""" Interns byte strings, so repeated names and units share one copy.
+	    Interned strings are freed with their last reference """
+
+	return intern(s) if type(s) is str else s
+
+
+class Ingredient(object):
 	""" Ingredient """
 
+	__slots__   = ("name", "unit", "level", "format", "quantity", "isOptional", "description")
+	conversions = CONVERSIONS
+
 	def __init__(self, name, unit, quantity, format, description):
 
 		# self.products    = products
-		self.name        = name
-		self.unit        = unit
+		self.name        = shared_string(name)
+		self.unit        = shared_string(unit)
 		self.level       = 1
-		self.format      = format
+		self.format      = shared_string(format)
 		self.quantity    = quantity
 		self.isOptional  = 1 if description.find(" OR ") != -1 else 0
-		self.description = description
-
-		# 1 cup is 48 teaspoons (tsp)
-		self.conversions = {
-		"cup":float(1.0),
-		"can":float(1.0),
-		"tsp":float(48.0),
-		"tbsp":float(16.0),
-		"lb":float(0.00779),
-		"qt":float(0.25),
-		"pt":float(0.5),
-		"oz":float(8.0),
-		"gal":float(0.0625),
-		"gr":float(3.5437),
-		"mg":float(3543.7),
-		"kg":float(0.00354),
-		"l":float(0.236),
-		"ml":float(236.59),
-		"pinch":float(768.0),
-		"dash":float(384.0),
-		"drop":float(2880.0),
-		"touch":float(2000.0),
-		"clove":float(96.0),
-		"each":float(8)
-		}
+		self.description = shared_string(description)
+
+	def __getstate__(self):
+		""" The slot values, as pickle needs them with __slots__ """
+
+		return dict((slot, getattr(self, slot)) for slot in self.__slots__ if hasattr(self, slot))
+
+
+	def __setstate__(self, state):
+		""" Restores the slot values """
+
+		for slot, value in state.items():
+			setattr(self, slot, value)
+
+		for slot in ("name", "unit", "format", "description"):
+			if hasattr(self, slot):
+				setattr(self, slot, shared_string(getattr(self, slot)))
+
 
 	def convert_to_cup(self):
 		""" Convert quantity to cup unit quantity """
@@ -0,0 +1,127 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# ingredient_table.py : defines the IngredientTable class
+#
+# The ingredient lines of a whole corpus as columns: the
+# recipe id, name code, unit code and quantity of every
+# line. The conversion to cups, the merge of the lines of
+# a recipe with the same ingredient, the max quantities
+# and the normalized points are each one array operation
+# over the whole corpus. The recipes are not modified.
+#
+######################################################
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from ingredient import CONVERSIONS
+from sparse_points import SparsePoints
+
+
+class IngredientTable:
+	""" Columnar table of the ingredient lines of a list of recipes """
+
+	def __init__(self, recipes):
+
+		name_codes = {}
+		unit_codes = {}
+
+		self.names = [] # Name of each name code, in order of appearance
+		self.units = [] # Unit of each unit code
+
+		recipe_ids, names, units, quantities = [], [], [], []
+
+		for recipe_id, recipe in enumerate(recipes):
+
+			# Ranked recipes already hold each total in cups, on every line
+			merged = getattr(recipe, "merged", False)
+			seen   = set()
+
+			for ingredient in recipe.ingredients:
+
+				unit = "cup" if merged else ingredient.unit
+				if merged and ingredient.name in seen:
+					continue
+				seen.add(ingredient.name)
+
+				if ingredient.name not in name_codes:
+					name_codes[ingredient.name] = len(self.names)
+					self.names.append(ingredient.name)
+				if unit not in unit_codes:
+					unit_codes[unit] = len(self.units)
+					self.units.append(unit)
+
+				recipe_ids.append(recipe_id)
+				names.append(name_codes[ingredient.name])
+				units.append(unit_codes[unit])
+				quantities.append(ingredient.quantity)
+
+		self.n_recipes = len(recipes)
+		self.recipe    = np.array(recipe_ids, dtype=np.int64)
+		self.name      = np.array(names, dtype=np.int64)
+		self.unit      = np.array(units, dtype=np.int64)
+		self.quantity  = np.array(quantities, dtype=float)
+		self.factors   = np.array([CONVERSIONS.get(unit, 1) for unit in self.units], dtype=float)
+
+
+	def __len__(self):
+
+		return len(self.quantity)
+
+
+	def cups(self):
+		""" Quantity of every line in cups """
+
+		return self.quantity / self.factors[self.unit]
+
+
+	def merged(self):
+		""" (recipe ids, name codes, quantities in cups) of the distinct
+		    ingredients of each recipe, sorted by recipe and name code """
+
+		n_names = max(len(self.names), 1)
+
+		keys, inverse = np.unique(self.recipe * n_names + self.name, return_inverse=True)
+		sums = np.bincount(inverse, weights=self.cups(), minlength=len(keys))
+
+		return keys // n_names, keys % n_names, sums
+
+
+	def max_quantities(self):
+		""" Dictionary of the max merged quantity of each named ingredient """
+
+		recipe, name, sums = self.merged()
+
+		maxima = np.full(len(self.names), -np.inf)
+		np.maximum.at(maxima, name, sums)
+
+		return dict((self.names[c], float(maxima[c])) for c in range(len(self.names))
+		            if self.names[c] != "undifined")
+
+
+	def points(self, ingredient_ids, maxima, dimensions, merged=None):
+		""" SparsePoints of the recipes: the merged quantity of each known
+		    ingredient (dimension ingredient_ids[name]) over its max quantity.
+		    merged is the result of merged(), computed when not given """
+
+		recipe, name, sums = merged if merged is not None else self.merged()
+
+		dims  = np.array([ingredient_ids.get(n, -1) for n in self.names], dtype=np.int64)[name]
+		norms = np.array([maxima.get(n, 1) for n in self.names], dtype=float)[name]
+
+		known = dims >= 0
+		order = np.lexsort((dims[known], recipe[known]))
+
+		indptr = np.zeros(self.n_recipes + 1, dtype=np.int64)
+		indptr[1:] = np.cumsum(np.bincount(recipe[known], minlength=self.n_recipes))
+
+		values = (sums[known] / norms[known])[order]
+
+		return SparsePoints(indptr, dims[known][order], values, dimensions)
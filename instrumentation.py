@@ -0,0 +1,235 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# instrumentation.py : timers, counters and profiling
+#
+# The Parser, Recommender and Clustering report where
+# their time goes through this module:
+#
+#   with instrumentation.timer("parse.tagging"):
+#       ...
+#   instrumentation.count("parse.lines")
+#
+# Nothing is measured until enable() is called: timer
+# then returns a shared object that does nothing and
+# count returns at once. The events go to sinks, objects
+# with a record(kind, name, value) method: a MemorySink
+# adds them up, a StreamSink writes one line per event.
+# profile(stage) samples the functions running inside
+# every timer of that stage.
+#
+# Stages:   parse.xml, parse.tagging, parse.concepts,
+#           points.table, points.conversion, points.build, index.build,
+#           knn.search, kmeans, service.batch
+# Counters: parse.lines, parse.fast_path, parse.tagger_path,
+#           parse.combinations, knn.queries, service.requests,
+#           kmeans.iterations, kmeans.distance_evaluations
+#
+######################################################
+
+# Python Modules
+import signal
+import threading
+from timeit import default_timer
+from collections import defaultdict
+
+enabled    = False
+_sinks     = []
+_profilers = {} # Stage -> SamplingProfiler
+
+
+class MemorySink:
+	""" Adds up the events: total count, total time and calls of each name """
+
+	def __init__(self):
+
+		self.counts = defaultdict(int)
+		self.times  = defaultdict(float)
+		self.calls  = defaultdict(int)
+
+
+	def record(self, kind, name, value):
+
+		if kind == "count":
+			self.counts[name] += value
+		else:
+			self.times[name] += value
+			self.calls[name] += 1
+
+
+	def report(self):
+		""" Returns {"counts": {name: n}, "times": {name: (seconds, calls)}} """
+
+		return {
+			"counts": dict(self.counts),
+			"times": dict((name, (self.times[name], self.calls[name])) for name in self.times)
+		}
+
+
+class StreamSink:
+	""" Writes every event as a "kind name value" line """
+
+	def __init__(self, stream):
+
+		self.stream = stream
+
+
+	def record(self, kind, name, value):
+
+		self.stream.write("%s %s %s\n" % (kind, name, value))
+
+
+class SamplingProfiler:
+	""" Counts the function running every interval seconds of CPU time.
+	    Uses SIGPROF, so it only samples when started from the main thread """
+
+	def __init__(self, interval=0.005):
+
+		self.interval = interval
+		self.samples  = defaultdict(int) # (file, function, line) -> samples
+		self.depth    = 0
+		self.previous = None
+
+
+	def _sample(self, signum, frame):
+
+		if frame is not None:
+			code = frame.f_code
+			self.samples[(code.co_filename, code.co_name, frame.f_lineno)] += 1
+
+
+	def start(self):
+
+		if not isinstance(threading.current_thread(), threading._MainThread):
+			return
+
+		self.depth += 1
+		if self.depth == 1:
+			self.previous = signal.signal(signal.SIGPROF, self._sample)
+			signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+
+	def stop(self):
+
+		if not isinstance(threading.current_thread(), threading._MainThread) or self.depth == 0:
+			return
+
+		self.depth -= 1
+		if self.depth == 0:
+			signal.setitimer(signal.ITIMER_PROF, 0, 0)
+			signal.signal(signal.SIGPROF, self.previous)
+
+
+	def top(self, n=10):
+		""" The n most sampled (samples, (file, function, line)) """
+
+		return sorted(((count, where) for where, count in self.samples.items()), reverse=True)[:n]
+
+
+class _Timer(object):
+	""" Measures the time of a with block """
+
+	__slots__ = ("name", "start", "profiler")
+
+	def __init__(self, name):
+
+		self.name     = name
+		self.profiler = _profilers.get(name)
+
+
+	def __enter__(self):
+
+		if self.profiler is not None:
+			self.profiler.start()
+		self.start = default_timer()
+
+		return self
+
+
+	def __exit__(self, *exc_info):
+
+		_emit("time", self.name, default_timer() - self.start)
+		if self.profiler is not None:
+			self.profiler.stop()
+
+		return False
+
+
+class _NullTimer(object):
+	""" Timer used while instrumentation is disabled """
+
+	__slots__ = ()
+
+	def __enter__(self):
+
+		return self
+
+
+	def __exit__(self, *exc_info):
+
+		return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _emit(kind, name, value):
+
+	for sink in _sinks:
+		sink.record(kind, name, value)
+
+
+def timer(name):
+	""" Context manager that reports the time of its block as stage name """
+
+	if not enabled:
+		return _NULL_TIMER
+
+	return _Timer(name)
+
+
+def count(name, n=1):
+	""" Adds n to the counter name """
+
+	if enabled:
+		_emit("count", name, n)
+
+
+def enable(sink=None):
+	""" Starts sending the events to sink (a new MemorySink by default),
+	    in addition to the sinks already added. Returns the sink """
+
+	global enabled
+
+	if sink is None:
+		sink = MemorySink()
+
+	_sinks.append(sink)
+	enabled = True
+
+	return sink
+
+
+def disable():
+	""" Stops measuring and forgets the sinks and profilers """
+
+	global enabled
+
+	enabled = False
+	del _sinks[:]
+	_profilers.clear()
+
+
+def profile(stage, interval=0.005):
+	""" Samples the functions running inside the timers of stage.
+	    Returns the SamplingProfiler holding the samples """
+
+	profiler = SamplingProfiler(interval)
+	_profilers[stage] = profiler
+
+	return profiler
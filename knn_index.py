@@ -0,0 +1,470 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# knn_index.py : defines the k-nearest neighbour indexes
+#
+# A KDTreeIndex splits the points on the dimension with
+# the largest spread and answers queries with a bounded
+# heap, pruning the branches that cannot hold a closer
+# point. A BruteForceIndex computes all the distances
+# with one matrix operation, which is faster when the
+# dimensionality makes the tree useless. For SparsePoints
+# the distances come from sparse dot products.
+#
+# Distances are squared euclidean, as in kdtree.
+#
+# batch_query answers many queries at once: the brute
+# force indexes compute the distances of a whole block of
+# queries at once. Sparse queries only read the columns of
+# their ingredients.
+#
+# An InvertedIndex only scores the recipes found in the
+# posting lists of the query ingredients, so its cost
+# depends on the posting list sizes, not the corpus size.
+#
+# remove(ids) masks points out of every index: they are
+# skipped inside the search, so a query costs the same
+# however many points were removed.
+#
+######################################################
+
+# Python Modules
+import heapq
+from multiprocessing.pool import ThreadPool
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from sparse_points import SparseVector, SparsePoints, dense_vector
+
+
+def _removed_mask(removed, ids, n):
+	""" Boolean mask of the n points that are removed: those of the
+	    previous mask (None for none) and the given ids """
+
+	mask = np.zeros(n, dtype=bool)
+	if removed is not None:
+		mask[:len(removed)] = removed[:n]
+	mask[np.asarray(list(ids), dtype=np.int64)] = True
+
+	return mask
+
+
+def _k_smallest(dist, k):
+	""" Returns a sorted list of (distance, index) of the k smallest distances """
+
+	n = len(dist)
+	k = min(k, n)
+	if k <= 0:
+		return []
+
+	# Only sort the k best candidates
+	if k < n:
+		best = np.argpartition(dist, k - 1)[:k]
+	else:
+		best = np.arange(n)
+	best = best[np.argsort(dist[best], kind="mergesort")]
+
+	return [(float(dist[i]), int(i)) for i in best]
+
+
+def _k_smallest_rows(dist, k):
+	""" _k_smallest of every row of an (m, n) distance matrix """
+
+	m, n = dist.shape
+	k    = min(k, n)
+	if k <= 0:
+		return [[] for i in range(m)]
+
+	rows = np.arange(m)[:, None]
+	if k < n:
+		best = np.argpartition(dist, k - 1, axis=1)[:, :k]
+	else:
+		best = np.tile(np.arange(n), (m, 1))
+	best = best[rows, np.argsort(dist[rows, best], axis=1, kind="mergesort")]
+	vals = dist[rows, best]
+
+	return [zip(vals[r].tolist(), best[r].tolist()) for r in range(m)]
+
+
+class BruteForceIndex:
+	""" Vectorized exhaustive search """
+
+	def __init__(self, points):
+
+		self.data       = np.asarray(points, dtype=float)
+		self.dimensions = self.data.shape[1]
+		self.sq_norms   = (self.data * self.data).sum(axis=1)
+		self.removed    = None # Mask of the removed points
+
+
+	def __len__(self):
+
+		return self.data.shape[0]
+
+
+	def remove(self, ids):
+		""" Never returns the given point ids again """
+
+		self.removed = _removed_mask(self.removed, ids, len(self))
+
+
+	def query(self, point, k):
+		""" Returns a sorted list of (distance, index) of the k nearest points """
+
+		if len(self) == 0:
+			return []
+
+		q    = dense_vector(point, self.dimensions)
+		dist = self.sq_norms - 2.0 * np.dot(self.data, q) + np.dot(q, q)
+		np.maximum(dist, 0.0, out=dist)
+		if self.removed is not None:
+			dist[self.removed] = np.inf
+
+		return _k_smallest(dist, k)
+
+
+	def block_distances(self, block):
+		""" Distances from each query point of block to every point (m, n) """
+
+		Q    = np.vstack([dense_vector(p, self.dimensions) for p in block])
+		dist = (Q * Q).sum(axis=1)[:, None] - 2.0 * np.dot(Q, self.data.T) + self.sq_norms[None, :]
+		np.maximum(dist, 0.0, out=dist)
+		if self.removed is not None:
+			dist[:, self.removed] = np.inf
+
+		return dist
+
+
+class SparseBruteForceIndex:
+	""" Exhaustive search over SparsePoints with sparse dot products """
+
+	def __init__(self, points):
+
+		self.data       = points
+		self.dimensions = points.dimensions
+		self.removed    = None # Mask of the removed points
+
+
+	def __len__(self):
+
+		return len(self.data)
+
+
+	def update(self):
+		""" Follows the points after they changed in place """
+
+		self.dimensions = self.data.dimensions
+		if self.removed is not None:
+			self.removed = _removed_mask(self.removed, [], len(self))
+
+
+	def remove(self, ids):
+		""" Never returns the given point ids again """
+
+		self.removed = _removed_mask(self.removed, ids, len(self))
+
+
+	def query(self, point, k):
+		""" Returns a sorted list of (distance, index) of the k nearest points """
+
+		if len(self) == 0:
+			return []
+
+		dist = self.data.sq_distances(point)
+		if self.removed is not None:
+			dist[self.removed] = np.inf
+
+		return _k_smallest(dist, k)
+
+
+	def block_distances(self, block):
+		""" Distances from each query point of block to every point (m, n) """
+
+		if all(isinstance(p, SparseVector) for p in block):
+			dist = self.data.sq_distances_vectors(block)
+		else:
+			Q    = np.vstack([dense_vector(p, self.dimensions) for p in block])
+			dist = (Q * Q).sum(axis=1)[:, None] - 2.0 * self.data.dot(Q).T + self.data.sq_norms()[None, :]
+			np.maximum(dist, 0.0, out=dist)
+
+		if self.removed is not None:
+			dist[:, self.removed] = np.inf
+
+		return dist
+
+
+class InvertedIndex:
+	""" Search over SparsePoints through the posting lists of the query
+	    ingredients: the recipes (columns of the CSC view) that use them """
+
+	def __init__(self, points, min_shared=1):
+
+		self.data       = points
+		self.min_shared = max(1, min_shared)
+		self.removed    = None # Mask of the removed points
+		self.update()
+
+
+	def __len__(self):
+
+		return len(self.data)
+
+
+	def update(self):
+		""" Follows the points after they changed in place """
+
+		self.dimensions = self.data.dimensions
+		self.by_norm    = np.argsort(self.data.sq_norms(), kind="mergesort")
+		if self.removed is not None:
+			self.removed = _removed_mask(self.removed, [], len(self))
+			self.by_norm = self.by_norm[~self.removed[self.by_norm]]
+
+		self.data.columns()
+
+
+	def remove(self, ids):
+		""" Never returns the given point ids again """
+
+		self.removed = _removed_mask(self.removed, ids, len(self))
+		self.by_norm = self.by_norm[~self.removed[self.by_norm]]
+
+
+	def candidates(self, point):
+		""" Ids of the points sharing ingredients with the point, their
+		    products with it and the number of ingredients they share """
+
+		if isinstance(point, SparseVector):
+			indices, values = point.indices, point.values
+		else:
+			q       = dense_vector(point, self.dimensions)
+			indices = np.nonzero(q)[0]
+			values  = q[indices]
+
+		col_indptr, col_rows, col_data = self.data.columns()
+
+		rows     = [col_rows[col_indptr[c]:col_indptr[c + 1]] for c in indices.tolist()]
+		products = [v * col_data[col_indptr[c]:col_indptr[c + 1]] for c, v in zip(indices.tolist(), values.tolist())]
+		if len(rows) == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+
+		ids, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+		dots   = np.bincount(inverse, weights=np.concatenate(products), minlength=len(ids))
+		shared = np.bincount(inverse, minlength=len(ids))
+
+		return ids, dots, shared
+
+
+	def query(self, point, k):
+		""" Returns a sorted list of (distance, index) of the k nearest points
+		    sharing at least min_shared ingredients with the point. With
+		    min_shared 1 the result is exact: a point sharing nothing is at
+		    |q|^2 + |x|^2, so only the smallest norms can enter the result """
+
+		ids, dots, shared = self.candidates(point)
+
+		keep = shared >= self.min_shared
+		if self.removed is not None:
+			keep &= ~self.removed[ids]
+		ids  = ids[keep]
+
+		if isinstance(point, SparseVector):
+			q_norm = point.sq_norm()
+		else:
+			q_norm = float(np.square(dense_vector(point, self.dimensions)).sum())
+
+		dist = self.data.sq_norms()[ids] - 2.0 * dots[keep] + q_norm
+
+		if self.min_shared == 1:
+			others = self.by_norm[:k + len(ids)]
+			others = others[~np.in1d(others, ids, assume_unique=True)][:k]
+			ids    = np.concatenate([ids, others])
+			dist   = np.concatenate([dist, self.data.sq_norms()[others] + q_norm])
+
+		np.maximum(dist, 0.0, out=dist)
+
+		return [(d, int(ids[i])) for d, i in _k_smallest(dist, k)]
+
+
+class KDTreeIndex:
+	""" KD-Tree with bounded heap search and branch pruning """
+
+	def __init__(self, points, leaf_size=16):
+
+		self.data       = np.asarray(points, dtype=float)
+		self.dimensions = self.data.shape[1]
+		self.leaf_size  = max(1, leaf_size)
+		self.perm       = np.arange(self.data.shape[0])
+		self.removed    = None # Mask of the removed points
+
+		# Flat node storage: a leaf has split_dim -1 and a
+		# range [start, end) of perm, an inner node has children
+		self.split_dim = []
+		self.split_val = []
+		self.left      = []
+		self.right     = []
+		self.start     = []
+		self.end       = []
+
+		if len(self) > 0:
+			self._build(0, len(self))
+
+
+	def __len__(self):
+
+		return self.data.shape[0]
+
+
+	def remove(self, ids):
+		""" Never returns the given point ids again """
+
+		self.removed = _removed_mask(self.removed, ids, len(self))
+
+
+	def _new_node(self, start, end):
+		""" Appends an empty node and returns its id """
+
+		self.split_dim.append(-1)
+		self.split_val.append(0.0)
+		self.left.append(-1)
+		self.right.append(-1)
+		self.start.append(start)
+		self.end.append(end)
+
+		return len(self.split_dim) - 1
+
+
+	def _build(self, start, end):
+		""" Builds the subtree of perm[start:end] and returns its id """
+
+		node = self._new_node(start, end)
+		if end - start <= self.leaf_size:
+			return node
+
+		# Split on the dimension with the largest spread
+		idx    = self.perm[start:end]
+		values = self.data[idx]
+		spread = values.max(axis=0) - values.min(axis=0)
+		dim    = int(np.argmax(spread))
+		if spread[dim] == 0: # All points are equal
+			return node
+
+		# Median partition
+		mid   = (end - start) // 2
+		order = np.argpartition(values[:, dim], mid)
+		self.perm[start:end] = idx[order]
+
+		self.split_dim[node] = dim
+		self.split_val[node] = float(self.data[self.perm[start + mid], dim])
+
+		left  = self._build(start, start + mid)
+		right = self._build(start + mid, end)
+		self.left[node]  = left
+		self.right[node] = right
+
+		return node
+
+
+	def _search(self, node, q, k, heap):
+		""" Depth-first search keeping the k best in a max-heap of (-dist, index) """
+
+		dim = self.split_dim[node]
+
+		# Leaf: compare against all its points
+		if dim == -1:
+			idx  = self.perm[self.start[node]:self.end[node]]
+			if self.removed is not None:
+				idx = idx[~self.removed[idx]]
+			diff = self.data[idx] - q
+			dist = (diff * diff).sum(axis=1)
+			for d, i in zip(dist.tolist(), idx.tolist()):
+				if len(heap) < k:
+					heapq.heappush(heap, (-d, -i))
+				elif d < -heap[0][0]:
+					heapq.heapreplace(heap, (-d, -i))
+			return
+
+		# Visit the side of the query first
+		delta = q[dim] - self.split_val[node]
+		if delta < 0:
+			near, far = self.left[node], self.right[node]
+		else:
+			near, far = self.right[node], self.left[node]
+
+		self._search(near, q, k, heap)
+
+		# Prune the other side if it cannot hold a closer point
+		if len(heap) < k or delta * delta < -heap[0][0]:
+			self._search(far, q, k, heap)
+
+
+	def query(self, point, k):
+		""" Returns a sorted list of (distance, index) of the k nearest points """
+
+		k = min(k, len(self))
+		if k <= 0:
+			return []
+
+		heap = []
+		self._search(0, dense_vector(point, self.dimensions), k, heap)
+
+		return sorted((-d, -i) for d, i in heap)
+
+
+def create_index(points, leaf_size=16):
+	""" Returns the best index for the given points: a KD-Tree
+	    only pays off when there are many more points than 2^dimensions """
+
+	if isinstance(points, SparsePoints):
+		n, d = len(points), points.dimensions
+		if d < 32 and 2 ** d < n:
+			return KDTreeIndex(points.to_dense(), leaf_size)
+		return SparseBruteForceIndex(points)
+
+	data = np.asarray(points, dtype=float)
+	if data.size == 0:
+		return BruteForceIndex(np.zeros((0, 0)))
+
+	n, d = data.shape
+	if d < 32 and 2 ** d < n:
+		return KDTreeIndex(data, leaf_size)
+
+	return BruteForceIndex(data)
+
+
+def batch_query(index, points, k, block_size=256, threads=1, max_block_values=1 << 20):
+	""" Returns the query results of many points, in order. The brute force
+	    indexes compute a block of queries at once, with at most
+	    max_block_values distances in memory per block; blocks run in
+	    threads (numpy releases the GIL in the matrix products) """
+
+	points = list(points)
+	if len(index) == 0:
+		return [[] for p in points]
+
+	# Fewer queries per block for large corpora
+	block_size = max(1, min(block_size, max_block_values // len(index)))
+	blocks     = [points[i:i + block_size] for i in range(0, len(points), block_size)]
+
+	def run(block):
+		if not hasattr(index, "block_distances"):
+			return [index.query(p, k) for p in block]
+		return _k_smallest_rows(index.block_distances(block), k)
+
+	if threads > 1 and len(blocks) > 1:
+		pool = ThreadPool(threads)
+		try:
+			results = pool.map(run, blocks)
+		finally:
+			pool.close()
+	else:
+		results = [run(block) for block in blocks]
+
+	return [r for block in results for r in block]
+
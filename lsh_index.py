@@ -0,0 +1,181 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# lsh_index.py : defines the MinHashLSHIndex class
+#
+# Approximate nearest neighbours over the ingredient
+# sets. Every recipe gets a MinHash signature of
+# bands x rows hashes of its ingredient ids. Two recipes
+# with Jaccard similarity s share at least one band with
+# probability 1 - (1 - s^rows)^bands, so more bands raise
+# the recall and more rows make the candidates fewer and
+# closer. Only the candidates that share a band with the
+# query are compared with the exact distance.
+#
+######################################################
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from knn_index import _k_smallest, _removed_mask, create_index
+from sparse_points import SparseVector, dense_vector
+
+# Mersenne prime of the hash functions (a * x + b) mod PRIME
+PRIME = (1 << 31) - 1
+
+
+class MinHashLSHIndex:
+	""" MinHash locality sensitive hashing index over SparsePoints """
+
+	def __init__(self, points, bands=16, rows=4, seed=0, block_size=4096):
+
+		self.data       = points
+		self.dimensions = points.dimensions
+		self.bands      = bands
+		self.rows       = rows
+
+		rng = np.random.RandomState(seed)
+		self.a = rng.randint(1, PRIME, size=bands * rows).astype(np.int64)
+		self.b = rng.randint(0, PRIME, size=bands * rows).astype(np.int64)
+
+		# Band keys of every point, sorted per band for the lookups
+		self.block_size = block_size
+		self.order      = np.zeros((bands, 0), dtype=np.int64)
+		self.keys       = np.zeros((bands, 0), dtype=np.int64)
+		self.indexed    = 0
+		self.removed    = None # Mask of the removed points
+		self.update()
+
+
+	def __len__(self):
+
+		return len(self.data)
+
+
+	def update(self):
+		""" Hashes the points appended since the last update. The values of
+		    the other points may change, but not their ingredients """
+
+		self.dimensions = self.data.dimensions
+		self.exact      = None
+		if self.removed is not None:
+			self.removed = _removed_mask(self.removed, [], len(self))
+
+		blocks = [self._band_keys(self._signatures(self.data.slice(start, start + self.block_size)))
+		          for start in range(self.indexed, len(self.data), self.block_size)]
+		if len(blocks) == 0:
+			return
+
+		keys  = np.hstack([self.keys, np.vstack(blocks).T])
+		ids   = np.hstack([self.order, np.tile(np.arange(self.indexed, len(self.data)), (self.bands, 1))])
+		order = np.argsort(keys, axis=1, kind="mergesort")
+		rows  = np.arange(self.bands)[:, None]
+
+		self.keys    = keys[rows, order]
+		self.order   = ids[rows, order]
+		self.indexed = len(self.data)
+
+
+	def remove(self, ids):
+		""" Never returns the given point ids again """
+
+		self.removed = _removed_mask(self.removed, ids, len(self))
+		if self.exact is not None:
+			self.exact.remove(ids)
+
+
+	def _signatures(self, block):
+		""" MinHash signature (n, bands * rows) of each point of the block.
+		    A point without ingredients gets PRIME everywhere """
+
+		n    = len(block)
+		sigs = np.full((n, len(self.a)), PRIME, dtype=np.int64)
+
+		nonempty = np.diff(block.indptr) > 0
+		if block.nnz() > 0:
+			hashes = (block.indices[:, None] * self.a[None, :] + self.b[None, :]) % PRIME
+			sigs[nonempty] = np.minimum.reduceat(hashes, block.indptr[:-1][nonempty], axis=0)
+
+		return sigs
+
+
+	def _band_keys(self, sigs):
+		""" Combines the rows of each band into one key (n, bands):
+		    key = (key * 1000003 + row) mod PRIME. Keys stay below 2^31,
+		    so key * 1000003 + row never overflows int64 """
+
+		sigs = sigs.reshape(len(sigs), self.bands, self.rows)
+		keys = np.zeros((len(sigs), self.bands), dtype=np.int64)
+		for r in range(self.rows):
+			keys = (keys * 1000003 + sigs[:, :, r]) % PRIME
+
+		return keys
+
+
+	def candidates(self, point):
+		""" Ids of the points sharing at least one band with the point """
+
+		if isinstance(point, SparseVector):
+			indices = point.indices
+		else:
+			indices = np.nonzero(dense_vector(point, self.dimensions))[0]
+
+		sig = np.full((1, len(self.a)), PRIME, dtype=np.int64)
+		if len(indices) > 0:
+			sig[0] = ((indices[:, None] * self.a[None, :] + self.b[None, :]) % PRIME).min(axis=0)
+		keys = self._band_keys(sig)[0]
+
+		found = []
+		for band in range(self.bands):
+			lo = np.searchsorted(self.keys[band], keys[band], side="left")
+			hi = np.searchsorted(self.keys[band], keys[band], side="right")
+			found.append(self.order[band, lo:hi])
+
+		return np.unique(np.concatenate(found))
+
+
+	def query(self, point, k):
+		""" Returns a sorted list of (distance, index) of about the k nearest
+		    points. Falls back to the exact search when there are less than
+		    k candidates """
+
+		ids  = self.candidates(point)
+		live = len(self)
+		if self.removed is not None:
+			ids  = ids[~self.removed[ids]]
+			live = live - int(self.removed.sum())
+
+		if len(ids) < min(k, live):
+			if self.exact is None:
+				self.exact = create_index(self.data)
+				if self.removed is not None:
+					self.exact.remove(np.nonzero(self.removed)[0])
+			return self.exact.query(point, k)
+
+		q    = dense_vector(point, self.dimensions)
+		dist = self.data.sq_norms()[ids] - 2.0 * self.data.dot_rows(ids, q) + np.dot(q, q)
+		np.maximum(dist, 0.0, out=dist)
+
+		return [(d, int(ids[i])) for d, i in _k_smallest(dist, k)]
+
+
+def measure_recall(approximate, exact, points, k):
+	""" Average fraction of the exact k nearest neighbours of the
+	    points that the approximate index also returns """
+
+	recalls = []
+
+	for point in points:
+		truth = set(i for dist, i in exact.query(point, k))
+		if len(truth) == 0:
+			continue
+		found = set(i for dist, i in approximate.query(point, k))
+		recalls.append(float(len(truth & found)) / len(truth))
+
+	return sum(recalls) / len(recalls) if len(recalls) > 0 else 1.0
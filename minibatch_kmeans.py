@@ -0,0 +1,195 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# minibatch_kmeans.py : defines the MiniBatchKMeans class
+#
+# Mini-batch k-means only keeps the k means and a count
+# of the points seen by each of them. The points are
+# consumed in batches, from an iterator, a (memory mapped)
+# array or SparsePoints: each batch is assigned to the
+# closest means, which move to the running mean of all the
+# points they received. partial_fit updates the clusters
+# with new recipes without running k-means again.
+#
+######################################################
+
+# Python Modules
+import random
+import itertools
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from clustering import Clustering
+from sparse_points import SparseVector, SparsePoints, pairwise_sq_distances
+
+
+class MiniBatchKMeans:
+	""" Mini-batch k-means """
+
+	def __init__(self, k, batch_size=1024, max_epochs=10, threshold=0.01, seed=None):
+
+		self.k          = k
+		self.batch_size = batch_size
+		self.max_epochs = max_epochs
+		self.threshold  = threshold
+		self.rng        = np.random.RandomState(seed)
+		self.centroids  = None # (k, d) array
+		self.counts     = None # Points seen by each mean
+		self.pending    = []   # First points, until there are k of them
+
+
+	def _as_batch(self, points):
+		""" SparsePoints or dense (n, d) array of the given points """
+
+		if isinstance(points, (SparsePoints, np.ndarray)):
+			return points
+
+		points = list(points)
+		if len(points) > 0 and isinstance(points[0], SparseVector):
+			return SparsePoints.from_vectors(points, points[0].dimensions)
+
+		return np.asarray(points, dtype=float)
+
+
+	def _batches(self, points, shuffle=False):
+		""" Yields the batches of an indexable set of points,
+		    in random order with shuffle, or of an iterator """
+
+		if isinstance(points, (SparsePoints, np.ndarray, list)):
+			starts = np.arange(0, len(points), self.batch_size)
+			if shuffle:
+				self.rng.shuffle(starts)
+
+			for start in starts.tolist():
+				if isinstance(points, SparsePoints):
+					yield points.slice(start, start + self.batch_size)
+				else:
+					yield self._as_batch(points[start:start + self.batch_size])
+			return
+
+		iterator = iter(points)
+		while True:
+			batch = list(itertools.islice(iterator, self.batch_size))
+			if len(batch) == 0:
+				return
+			yield self._as_batch(batch)
+
+
+	def _sample(self, points, size):
+		""" Random sample of an indexable set of points """
+
+		ids = np.sort(self.rng.choice(len(points), min(size, len(points)), replace=False))
+
+		if isinstance(points, SparsePoints):
+			return SparsePoints.from_vectors([points.row(i) for i in ids], points.dimensions)
+		if isinstance(points, np.ndarray):
+			return points[ids]
+
+		return self._as_batch([points[i] for i in ids])
+
+
+	def _initialize(self, batch):
+		""" Means from a k-means++ run on the first batch. Clustering draws
+		    from the random module, which is seeded from self.rng for the
+		    run and then restored """
+
+		state = random.getstate()
+		random.seed(int(self.rng.randint(1 << 30)))
+		try:
+			clustering = Clustering(batch, engine="numpy", init="k-means++")
+			clustering.kmeans(self.k)
+		finally:
+			random.setstate(state)
+
+		self.centroids = np.asarray(clustering.means, dtype=float)
+		self.counts    = np.zeros(self.k)
+
+
+	def predict(self, points):
+		""" Returns the number of the closest mean of each point """
+
+		batch = self._as_batch(points)
+
+		return np.argmin(pairwise_sq_distances(batch, self.centroids), axis=1)
+
+
+	def partial_fit(self, points):
+		""" Updates the means with one batch of points.
+		    Returns the largest distance a mean moved """
+
+		batch = self._as_batch(points)
+
+		# Wait until there are enough points to pick k means
+		if self.centroids is None:
+			self.pending.append(batch)
+			if sum(len(b) for b in self.pending) < self.k:
+				return float("inf")
+			batch        = self._concatenate(self.pending)
+			self.pending = []
+			self._initialize(batch)
+
+		labels = self.predict(batch)
+		counts = np.bincount(labels, minlength=self.k).astype(float)
+
+		if isinstance(batch, SparsePoints):
+			sums = batch.sum_by_label(labels, self.k)
+		else:
+			sums = np.zeros_like(self.centroids)
+			np.add.at(sums, labels, batch)
+
+		# Running mean: every point seen by a mean has weight 1 / count
+		total = self.counts + counts
+		moved = counts > 0
+		old   = self.centroids.copy()
+		self.centroids[moved] += (sums[moved] - counts[moved][:, None] * old[moved]) / total[moved][:, None]
+		self.counts = total
+
+		return float(np.sqrt(((self.centroids - old) ** 2).sum(axis=1)).max())
+
+
+	def _concatenate(self, batches):
+		""" Joins batches of the same kind """
+
+		if isinstance(batches[0], SparsePoints):
+			vectors = [b.row(i) for b in batches for i in range(len(b))]
+			return SparsePoints.from_vectors(vectors, batches[0].dimensions)
+
+		return np.vstack(batches)
+
+
+	def fit(self, points):
+		""" Clusters the points. An indexable set of points (list, array or
+		    SparsePoints, possibly memory mapped) is read in shuffled batches
+		    until no mean moves more than threshold in an epoch; an iterator
+		    is read once, and should not be sorted by cluster since the
+		    means start from its first batch """
+
+		indexable = isinstance(points, (SparsePoints, np.ndarray, list))
+		epochs    = self.max_epochs if indexable else 1
+
+		# Means from a sample of all the points (an iterator uses its first batch)
+		if indexable and self.centroids is None and len(points) >= self.k:
+			self._initialize(self._sample(points, max(3 * self.k, self.batch_size)))
+
+		for epoch in range(epochs):
+			shift = 0.0
+			for batch in self._batches(points, shuffle=indexable):
+				shift = max(shift, self.partial_fit(batch))
+
+			if shift <= self.threshold:
+				break
+
+		return self
+
+
+	def means(self):
+		""" Returns the means as a list of tuples, as Clustering.means """
+
+		return [tuple(m) for m in self.centroids.tolist()]
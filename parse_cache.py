@@ -0,0 +1,123 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# parse_cache.py : defines the LRUCache class
+#
+# Recipe corpora repeat the same ingredient lines and
+# words many times. An LRUCache keeps the last results
+# of the NLP work in memory, counting hits and misses,
+# and can be backed by a shelve file so that later runs
+# reuse the results of the previous ones. The shelve
+# stores a validity key (e.g. a hash of the dictionary)
+# and is cleared when it is opened with a different one.
+#
+######################################################
+
+# Python Modules
+import shelve
+from collections import OrderedDict
+
+# Shelve entry holding the validity key, no text line starts with "\0"
+VALIDITY_KEY = "\0validity"
+
+
+class LRUCache:
+	""" Bounded least recently used cache """
+
+	def __init__(self, maxsize, path=None, validity=None):
+		""" maxsize 0 disables the memory layer, path enables the disk layer.
+		    The disk entries written with another validity key are dropped """
+
+		self.maxsize   = maxsize
+		self.entries   = OrderedDict()
+		self.store     = shelve.open(path, protocol=2) if path else None
+		self.hits      = 0
+		self.disk_hits = 0
+		self.misses    = 0
+
+		if self.store is not None and self.store.get(VALIDITY_KEY) != validity:
+			self.store.clear()
+			self.store[VALIDITY_KEY] = validity
+
+
+	def __len__(self):
+
+		return len(self.entries)
+
+
+	def _key(self, key):
+		""" shelve only accepts byte string keys """
+
+		if isinstance(key, unicode):
+			return key.encode("utf-8")
+
+		return key
+
+
+	def _remember(self, key, value):
+		""" Saves value in memory, dropping the least recently used entry """
+
+		if self.maxsize <= 0:
+			return
+
+		self.entries.pop(key, None)
+		self.entries[key] = value
+
+		if len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+
+
+	def get(self, key, default=None):
+		""" Returns the cached value of key, or default """
+
+		key = self._key(key)
+
+		if key in self.entries:
+			self.hits += 1
+			value = self.entries.pop(key) # Move to most recently used
+			self.entries[key] = value
+			return value
+
+		if self.store is not None and key in self.store:
+			self.disk_hits += 1
+			value = self.store[key]
+			self._remember(key, value)
+			return value
+
+		self.misses += 1
+
+		return default
+
+
+	def put(self, key, value):
+		""" Caches value for key """
+
+		key = self._key(key)
+		self._remember(key, value)
+
+		if self.store is not None:
+			self.store[key] = value
+
+
+	def stats(self):
+		""" Returns the hit and miss counters """
+
+		return {
+			"size":      len(self.entries),
+			"hits":      self.hits,
+			"disk_hits": self.disk_hits,
+			"misses":    self.misses
+		}
+
+
+	def close(self):
+		""" Writes the disk layer """
+
+		if self.store is not None:
+			self.store.close()
+			self.store = None
@@ -0,0 +1,75 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# phrase_matcher.py : defines the PhraseMatcher class
+#
+# A PhraseMatcher compiles the food concepts of the
+# dictionary into a trie of words. Instead of trying all
+# the 2^n word combinations of a description, it only
+# follows the words that continue a concept of the trie.
+#
+######################################################
+
+# Project Modules
+import instrumentation
+
+# Marks the trie nodes that end a concept
+END = None
+
+
+class PhraseMatcher:
+	""" Word trie of food concepts """
+
+	def __init__(self, phrases):
+
+		self.root = {}
+
+		for phrase in phrases:
+			node = self.root
+			for word in phrase.split(" "):
+				node = node.setdefault(word, {})
+			node[END] = phrase
+
+
+	def __contains__(self, phrase):
+
+		node = self.root
+		for word in phrase.split(" "):
+			if word not in node:
+				return False
+			node = node[word]
+
+		return END in node
+
+
+	def find_all(self, word_list):
+		""" Returns the concepts formed by any ordered subset of word_list,
+		    by number of words first, then by position of the words.
+		    Counts the word combinations explored as parse.combinations """
+
+		matches  = []
+		stack    = [(self.root, -1, ())]
+		explored = 0
+
+		while stack:
+			node, last, used = stack.pop()
+			explored += 1
+
+			if len(used) > 0 and END in node:
+				matches.append((len(used), used, node[END]))
+
+			# Only the following words that continue a concept
+			for i in range(last + 1, len(word_list)):
+				child = node.get(word_list[i])
+				if child is not None:
+					stack.append((child, i, used + (i,)))
+
+		instrumentation.count("parse.combinations", explored - 1) # Not the empty one
+		matches.sort()
+
+		return [concept for size, used, concept in matches]
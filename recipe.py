@@ -9,25 +9,99 @@
 # recipe.py : defines the Recipe class
 #
 # A Recipe consists of a name, a list of ingredients
-# and a cooking process.
+# and a cooking process. The process can stay in the XML
+# file and be read only when it is used.
 #
 ######################################################
 
 # Python Modules
 import operator
+import xml.etree.ElementTree as ET
 from collections import defaultdict
 
 # Project Modules
-from ingredient import Ingredient
+from ingredient import Ingredient, shared_string
 
-class Recipe:
+
+class SourceText(object):
+	""" Text of an XML element, read from the source file when needed """
+
+	__slots__ = ("path", "start", "end")
+
+	def __init__(self, path, start, end):
+
+		self.path  = path
+		self.start = start # Byte offsets of the element in the file
+		self.end   = end
+
+
+	def __getstate__(self):
+
+		return dict((slot, getattr(self, slot)) for slot in self.__slots__)
+
+
+	def __setstate__(self, state):
+
+		for slot, value in state.items():
+			setattr(self, slot, value)
+
+
+	def read(self):
+		""" Returns the lower case text of the element """
+
+		with open(self.path, 'rb') as f:
+			f.seek(self.start)
+			element = ET.fromstring(f.read(self.end - self.start))
+
+		return (element.text or "").lower()
+
+
+class Recipe(object):
 	""" Recipe """
 
+	__slots__ = ("name", "ingredients", "_process", "merged")
+
 	def __init__(self, name, ingr, process):
+		""" process is the text or a SourceText, read on each access """
 
-		self.name         = name
+		self.name         = shared_string(name)
 		self.ingredients  = ingr
 		self.cook_process = process
+		self.merged       = False # Quantities already summed in cups
+
+
+	def __getstate__(self):
+		""" The slot values, as pickle needs them with __slots__.
+		    A SourceText process stays a SourceText """
+
+		return dict((slot, getattr(self, slot)) for slot in self.__slots__ if hasattr(self, slot))
+
+
+	def __setstate__(self, state):
+		""" Restores the slot values """
+
+		self.merged = False
+
+		for slot, value in state.items():
+			setattr(self, slot, value)
+
+		self.name = shared_string(self.name)
+
+
+	@property
+	def cook_process(self):
+
+		if isinstance(self._process, SourceText):
+			return self._process.read()
+
+		return self._process
+
+
+	@cook_process.setter
+	def cook_process(self, process):
+
+		self._process = process
+
 
 	def _merge_ingredients(self):
 		""" Sum the quantities of ingredients with the same name, 
@@ -54,7 +128,10 @@ class Recipe:
 		# for ingredient in self.ingredients:
 		# 	ingredient.convert_to_cup()
 
-		self._merge_ingredients()
+		# Merge only once, the quantities are then in cups
+		if not self.merged:
+			self._merge_ingredients()
+			self.merged = True
 
 		sorted_ingredients = sorted(self.ingredients, key=lambda x: x.quantity, reverse=True)
 
@@ -11,31 +11,78 @@
 ######################################################
 
 # Python Modules
+import os
 import re
+import mmap
+import hashlib
 import itertools
+import multiprocessing
 import xml.etree.ElementTree as ET
 from fractions import Fraction
 
-# Textblob Library Modules
-from textblob import Word
-from textblob import TextBlob
+# Textblob Library Modules: imported by _textblob() when the
+# tagger is first needed, NLTK and its corpora load with it
 # from nltk.corpus import wordnet as wn
 
 # Project Modules
-from recipe import Recipe
+import instrumentation
+from recipe import Recipe, SourceText
 # from product import Product
 from ingredient import Ingredient
+from phrase_matcher import PhraseMatcher
+from parse_cache import LRUCache
+
+# Bump when the fields parsed from a line change, to drop the disk caches
+PARSER_VERSION = "1"
+
+# Parser of each worker process in parallel mode
+_worker_parser = None
+
+# Chunks of recipes sent to each worker at a time in parallel mode
+_WINDOW_CHUNKS = 4
+
+# The textblob module, once imported
+_textblob_module = None
+
+# Ingredient lines the fast path parses without the tagger:
+# "quantity unit name words; format words", in lower case.
+# The format can also follow a comma
+_FAST_LINE  = re.compile(r"^\s*(?:(\d+/\d+|\d*\.\d+|\d+)\s+)?([a-z][a-z ]*?)\s*(?:[;,]\s*([a-z ,]*?))?\s*$")
+# Words that the tagger reads as participles or adverbs
+_MODIFIER   = re.compile(r"(ed|ly)$|^(ground|beaten|frozen)$")
+_STOP_WORDS = frozenset(["a", "an", "the", "and", "or", "of", "with", "in", "into", "for", "to", "at", "on", "plus"])
 
 
 class Parser:
 	""" XML Parser """
 
-	def __init__(self, data_file, dictionary):
-		""" Creates the parser tree """
-
-		self.tree       = ET.parse(data_file)
-		self.root       = self.tree.getroot()
+	def __init__(self, data_file, dictionary, stream=False, cache_size=10000, cache_file=None, lazy_process=False,
+	             fast_path=True):
+		""" Creates the parser tree. In stream mode the file is parsed
+		    incrementally while iterating over the recipes instead.
+		    The last cache_size parsed lines and words are cached, and
+		    cache_file keeps the parsed lines on disk between runs
+		    (it is cleared when the dictionary or fast_path change).
+		    With lazy_process the recipes only keep the offsets of their
+		    cooking process in data_file, which must stay in place.
+		    The fast_path parses the simple ingredient lines without
+		    the TextBlob tagger """
+
+		self.data_file    = data_file
+		self.stream       = stream
+		self.lazy_process = lazy_process
+		self.tree       = None if stream else ET.parse(data_file)
+		self.root       = None if stream else self.tree.getroot()
 		self.dictionary = dictionary  # Food tree
+		self.matcher    = PhraseMatcher(dictionary)
+		self.cache_size = cache_size
+		self.line_cache = LRUCache(cache_size, cache_file, cache_key(dictionary, fast_path) if cache_file else None)
+		self.word_cache = LRUCache(cache_size)
+		self.fast_path  = fast_path
+		self.paths      = {"fast": 0, "tagger": 0} # Lines parsed by each path
+
+		# Words of the food concepts, that the fast path can not leave in the format
+		self.concept_words = set(word for phrase in dictionary for word in phrase.split(" "))
 
 		self.unit_measures = {
 			"c":"cup", "C":"cup", "cup":"cup",
@@ -67,14 +114,12 @@ class Parser:
 		return Product(name, unit, format, quantity)
 
 
-	def _food_concept(self, combinations):
-		""" Return a list of food concepts found in all combinations """
-		concepts = []
+	def _match_concepts(self, word_list):
+		""" Food concepts formed by any ordered subset of word_list, from
+		    the least to the most specific, or ["undifined"] """
 
-		for comb in combinations:
-			c = " ".join(comb)
-			if c in self.dictionary:
-				concepts.append(c)
+		with instrumentation.timer("parse.concepts"):
+			concepts = self.matcher.find_all(word_list)
 
 		if len(concepts) == 0:
 			concepts.append("undifined")
@@ -82,18 +127,6 @@ class Parser:
 		return concepts
 
 
-	def _all_combinations(self, word_list):
-		""" Generates a list of all possible word combinations in word_list """
-
-		combinations = []
-		for word in range(0, len(word_list)+1):
-			for subset in itertools.combinations(word_list, word):
-				if len(subset) > 0:
-					combinations.append(list(subset))
-
-		return combinations
-
-
 	def _extract_name(self, word_list):
 		""" Only keep the words that form a concept of the food tree """
 		
@@ -102,8 +135,7 @@ class Parser:
 		word_list = text.split(" ")
 
 		# Keep the combination of words that define a food concept
-		combinations = self._all_combinations(word_list)
-		name         = self._food_concept(combinations).pop() # Guarantees the most specific concept
+		name = self._match_concepts(word_list).pop() # Guarantees the most specific concept
 
 		return name
 
@@ -133,18 +165,117 @@ class Parser:
 		# 	return float(Fraction(s))
 
 
+	def _singularize(self, word):
+		""" Singular form of word, cached """
+
+		singular = self.word_cache.get(word)
+
+		if singular is None:
+			singular = str(_textblob().Word(word).singularize())
+			self.word_cache.put(word, singular)
+
+		return singular
+
+
 	def _parse_ingredient(self, description):
-		""" Parse the ingredient information """
+		""" Parse the ingredient information. Ingredient lines repeat a lot,
+		    so the parsed fields of the last lines are cached """
+
+		instrumentation.count("parse.lines")
+
+		fields = self.line_cache.get(description)
+
+		if fields is None:
+			fields = self._fast_description(description) if self.fast_path else None
+
+			if fields is not None:
+				self.paths["fast"] += 1
+				instrumentation.count("parse.fast_path")
+			else:
+				self.paths["tagger"] += 1
+				instrumentation.count("parse.tagger_path")
+				fields = self._parse_description(description)
+
+			self.line_cache.put(description, fields)
+
+		name, unit, quantity, format = fields
+
+		return Ingredient(name, unit, quantity, format, description)
+
+
+	def _name_word(self, word):
+		""" Word as the tagger path keeps it in a name """
+
+		if str(word) == "flour":
+			return str(word)
+
+		return self._singularize(word)
+
+
+	def _fast_description(self, description):
+		""" Returns the (name, unit, quantity, format) of a "quantity unit
+		    name; format" line as _parse_description would, or None when
+		    the line needs the tagger to tell the words apart. The tagger
+		    puts participles and adverbs before the name ("sliced" in
+		    "2 c sliced carrots") in the format, so the lines with such a
+		    word (_MODIFIER) that is not a concept word are left to it,
+		    and so are the formats with other words ("to taste", "sprig") """
+
+		match = _FAST_LINE.match(description)
+		if match is None:
+			return None
+
+		amount, words, format = match.groups()
+		words  = [self._name_word(w) for w in words.split()]
+		format = [w for w in re.split("[ ,]+", format or "") if w != ""]
+
+		# The unit must be the first word, and the only one
+		unit = ""
+		if words[0] in self.unit_measures:
+			unit = self.unit_measures[words.pop(0)]
+
+		if len(words) == 0:
+			return None
+		for w in words:
+			if w in _STOP_WORDS or w in self.unit_measures:
+				return None
+			if _MODIFIER.search(w) and w not in self.concept_words:
+				return None
+
+		# The tagger keeps format words only when they are not nouns or
+		# adjectives: participles, adverbs and "and", never concepts or units
+		for w in format:
+			if w != "and" and not _MODIFIER.search(w):
+				return None
+			singular = self._name_word(w)
+			if singular in self.unit_measures or w in self.concept_words or singular in self.concept_words:
+				return None
+
+		quantity = self._to_float(amount) if amount is not None else float(0)
+
+		if unit == "":
+			unit = "each"
+
+		if quantity == float(0):
+			unit     = "each"
+			quantity = 1
+
+		return (self._extract_name(words), unit, quantity, "".join(format))
+
+
+	def _parse_description(self, description):
+		""" Returns the (name, unit, quantity, format) of an ingredient line """
 
 		# ingredients = []
-		blob        = TextBlob(description)
+		with instrumentation.timer("parse.tagging"):
+			tags    = _textblob().TextBlob(description).tags
 		name_words  = []
 
 		quantity    = float(0)
 		format      = ""
 		name        = ""
 		unit        = ""
-		for word in blob.tags:
+		for word in tags:
 
 			# Extract ingredient quantity
 			if word[1] == unicode('CD') or word[0] == '2':
@@ -154,10 +285,7 @@ class Parser:
 
 			# Extract unit measurement and name
 			elif word[1] in ("NN", "NNS", "NNP", "NNPS", "VBG", "JJ"):
-				if str(word[0]) == "flour":
-					w = str(word[0])
-				else:
-					w = str(word[0].singularize())
+				w = self._name_word(word[0])
 
 				if w in self.unit_measures:
 					unit = self.unit_measures[w]
@@ -175,10 +303,9 @@ class Parser:
 			unit     = "each"
 			quantity = 1
 
-		name       = self._extract_name(name_words)
-		ingredient = Ingredient(name, unit, quantity, format, description)
+		name = self._extract_name(name_words)
 
-		return ingredient
+		return (name, unit, quantity, format)
 
 
 
@@ -191,8 +318,7 @@ class Parser:
 		description = description.replace(" or ", " ") # Remove OR
 
 		# Extract all the optional ingredients
-		combinations = self._all_combinations(description.split(" "))
-		all_names    = self._food_concept(combinations)
+		all_names = self._match_concepts(description.split(" "))
 
 		for name in all_names:
 			new_desc = description
@@ -208,31 +334,206 @@ class Parser:
 		return new_descriptions
 
 
-	def generate(self):
-		""" Generates a List of recipes From the XML"""
+	def _recipe_fields(self, child):
+		""" Returns the (name, ingredient descriptions, process) of a recipe element """
 
-		recipes = []
+		with instrumentation.timer("parse.xml"):
+			name         = child.find('ti').text
+			process      = child.find('pr').text
+			descriptions = [i.text for i in child.findall('in')]
 
-		for child in self.root.findall('recipe'):
-			name        = child.find('ti').text
-			process     = child.find('pr').text
+		return (name, descriptions, process)
 
-			ingredients = []
-			for i in child.findall('in'):
-				description = i.text.lower()
 
-				if " or " in description: # We have different options in one
-					options = self._separate(description)
+	def _parse_recipe(self, fields):
+		""" Creates a Recipe from the fields of its XML element """
 
-					for option in options:
-						ingredient = self._parse_ingredient(option)
-						ingredients.append(ingredient)
+		name, descriptions, process = fields
 
-				else:
-					ingredient = self._parse_ingredient(description)
+		ingredients = []
+		for text in descriptions:
+			description = text.lower()
+
+			if " or " in description: # We have different options in one
+				options = self._separate(description)
+
+				for option in options:
+					ingredient = self._parse_ingredient(option)
 					ingredients.append(ingredient)
 
-			recipe = Recipe(name.lower(), ingredients, process.lower())
-			recipes.append(recipe)
+			else:
+				ingredient = self._parse_ingredient(description)
+				ingredients.append(ingredient)
+
+		if not isinstance(process, SourceText):
+			process = process.lower()
+
+		return Recipe(name.lower(), ingredients, process)
+
+
+	def _stream_elements(self):
+		""" Yields each recipe element as soon as it is parsed,
+		    clearing the consumed elements to keep memory bounded """
+
+		root = None
+
+		for event, elem in ET.iterparse(self.data_file, events=("start", "end")):
+			if event == "start":
+				if root is None:
+					root = elem
+				continue
+
+			if elem.tag == "recipe":
+				yield elem
+				elem.clear()
+				root.clear() # Drop the reference to the consumed recipe
+
+
+	def _process_offsets(self):
+		""" Yields the byte offsets (start, end) of the <pr> elements of
+		    the file, in document order: one per recipe """
+
+		path = os.path.abspath(self.data_file)
+
+		with open(path, 'rb') as f:
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				for match in re.finditer(br"<pr\b[^>]*?(?:/>|>.*?</pr>)", data, re.DOTALL):
+					yield SourceText(path, match.start(), match.end())
+			finally:
+				data.close()
+
+
+	def _parallel_recipes(self, fields, workers, chunksize):
+		""" Parses the recipes in a pool of processes, in document order.
+		    pool.imap would read all the fields at once, so they are sent
+		    in windows of a few chunks per worker: the next window is sent
+		    while the results of the current one are read, and at most two
+		    windows of recipes are held in memory """
+
+		pool   = multiprocessing.Pool(workers, _init_worker, (self.dictionary, self.cache_size))
+		window = workers * chunksize * _WINDOW_CHUNKS
+
+		try:
+			current = None
+			while True:
+				block = list(itertools.islice(fields, window))
+				sent  = pool.imap(_parse_in_worker, block, chunksize) if len(block) > 0 else None
+
+				if current is not None:
+					for recipe in current:
+						yield recipe
+				if sent is None:
+					break
+				current = sent
+
+			pool.close()
+		finally:
+			pool.terminate()
+			pool.join()
+
+
+	def iter_recipes(self, workers=1, chunksize=16):
+		""" Yields the recipes of the XML one at a time.
+		    With workers > 1 (None for all cores) the ingredients are
+		    parsed in a process pool, in chunks of chunksize recipes.
+		    In stream mode only a few chunks per worker are read ahead """
+
+		if self.stream:
+			elements = self._stream_elements()
+		else:
+			elements = self.root.findall('recipe')
+
+		fields = (self._recipe_fields(child) for child in elements)
+
+		# Keep where the process is instead of its text
+		if self.lazy_process:
+			fields = ((name, descriptions, source) for (name, descriptions, process), source
+			          in itertools.izip(fields, self._process_offsets()))
+
+		if workers is None:
+			workers = multiprocessing.cpu_count()
+
+		if workers > 1:
+			recipes = self._parallel_recipes(fields, workers, chunksize)
+		else:
+			recipes = (self._parse_recipe(f) for f in fields)
+
+		for recipe in recipes:
+			yield recipe
+
+
+	def generate(self, workers=1, chunksize=16):
+		""" Generates a List of recipes From the XML"""
+
+		return list(self.iter_recipes(workers, chunksize))
+
+
+	def path_stats(self):
+		""" Lines parsed by the fast path and by the tagger, and the
+		    fraction that skipped the tagger (cache hits not included) """
+
+		total = self.paths["fast"] + self.paths["tagger"]
+
+		return {
+			"fast": self.paths["fast"],
+			"tagger": self.paths["tagger"],
+			"fast_fraction": float(self.paths["fast"]) / total if total > 0 else 0.0
+		}
+
+
+	def cache_stats(self):
+		""" Returns the hit and miss counters of the line and word caches """
+
+		return {
+			"lines": self.line_cache.stats(),
+			"words": self.word_cache.stats()
+		}
+
+
+	def close(self):
+		""" Writes the disk cache of parsed lines """
+
+		self.line_cache.close()
+
+
+def cache_key(dictionary, fast_path):
+	""" Hash of what the parsed lines depend on: the parser version,
+	    the food dictionary and the fast path """
+
+	h = hashlib.sha1(PARSER_VERSION + (" fast" if fast_path else " tagger"))
+
+	for concept in sorted(dictionary):
+		h.update(b"\0")
+		h.update(concept.encode("utf-8") if isinstance(concept, unicode) else concept)
+
+	return h.hexdigest()
+
+
+def _textblob():
+	""" The textblob module, imported on the first call """
+
+	global _textblob_module
+
+	if _textblob_module is None:
+		import textblob
+		_textblob_module = textblob
+
+	return _textblob_module
+
+
+def _init_worker(dictionary, cache_size):
+	""" Creates the parser of a worker process. The tagger is loaded by the
+	    first line that needs it, so a worker whose lines all take the fast
+	    path never loads it. Each worker has its own memory cache, the disk
+	    cache is not shared """
+
+	global _worker_parser
+
+	_worker_parser = Parser(None, dictionary, stream=True, cache_size=cache_size)
+
+
+def _parse_in_worker(fields):
+	""" Parses one recipe in a worker process """
 
-		return recipes
\ No newline at end of file
+	return _worker_parser._parse_recipe(fields)
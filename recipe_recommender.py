@@ -14,56 +14,134 @@
 #########################################################
 
 # Python Modules
+import random
 from collections import defaultdict
 
-# K-dtree Library Modules
-import kdtree
+# NumPy Modules
+import numpy as np
 
 # Project Modules
+import instrumentation
 from recipe import Recipe
 from ingredient import Ingredient
+from ingredient_table import IngredientTable
+from knn_index import create_index, InvertedIndex
+from lsh_index import MinHashLSHIndex, measure_recall
+from sparse_points import SparseVector
+from recommendation_index import RecommendationIndex
 
 class Recommender:
 	""" Recipes Recommender """
 
-	def __init__(self, recipes):
+	def __init__(self, recipes, ingredients_dic=None, ingredients=None, points=None):
+
+		self.index           = None
+		self.approximate     = None # MinHashLSHIndex parameters, exact search if None
+		self.min_shared      = None # Ingredients a recipe shares with a query, if pruned
+		self.set_recipes(recipes, ingredients_dic, ingredients, points)
+		# self.ingredients_dic = ingredients_dic
+
+
+	def set_recipes(self, recipes, ingredients_dic=None, ingredients=None, points=None):
+		""" Replaces the recipe set and invalidates the index.
+		    The ingredients (max quantities and dimension order) and the
+		    points saved from these same recipes skip their computation.
+		    Without the dimension order, the ingredients are taken in order
+		    of appearance in the recipes, as when they are computed. Saved
+		    points need the order they were created with """
+
+		if ingredients_dic is None:
+			table           = IngredientTable(recipes)
+			ingredients_dic = table.max_quantities()
+			ingredients     = [ingr for ingr in table.names if ingr in ingredients_dic]
+
+		elif ingredients is None:
+			if points is not None:
+				raise ValueError("The points need the ingredients (their dimension order) with ingredients_dic")
+
+			names       = IngredientTable(recipes).names
+			ingredients = [ingr for ingr in names if ingr in ingredients_dic]
+			ingredients += sorted(set(ingredients_dic) - set(ingredients))
 
 		self.recipes         = recipes
 		self.recipes_dic     = defaultdict(list)
-		self.ingredients_dic = self.extract_ingredients(recipes)
-		self.ingredients     = self.ingredients_dic.keys()
-		# self.ingredients_dic = ingredients_dic
+		self.ingredients_dic = ingredients_dic
+		self.ingredients     = list(ingredients)
+		self.ingredient_ids  = dict((ingr, i) for i, ingr in enumerate(self.ingredients))
+		self.points          = points
+		self.index           = None
+		self.removed         = set()
 
+		for recipe_id, recipe in enumerate(recipes):
+			self.recipes_dic[recipe_id].append( recipe.name )
 
-	def get_recipes(self):
-		""" Return the dictionary of recipes """
 
-		return self.recipes_dic
+	def add_recipes(self, recipes):
+		""" Adds recipes without rebuilding the points nor the index.
+		    A new ingredient becomes a new last dimension, and an ingredient
+		    with a new max quantity rescales its column of the old points.
+		    Returns the ids of the new recipes """
 
+		table   = IngredientTable(recipes)
+		found   = table.max_quantities()
+		factors = np.ones(len(self.ingredients))
 
-	def extract_ingredients(self, recipes):
-		""" Creates a dictionary with the ingredients found in the given recipes 
-		    keeping the maximum quantity found for each ingredient to normalize later"""
+		for ingr in table.names:
+			if ingr not in found:
+				continue
+			quantity = found[ingr]
+			if ingr not in self.ingredient_ids:
+				self.ingredient_ids[ingr]  = len(self.ingredients)
+				self.ingredients_dic[ingr] = quantity
+				self.ingredients.append(ingr)
+			elif quantity > self.ingredients_dic[ingr]:
+				factors[self.ingredient_ids[ingr]] = float(self.ingredients_dic[ingr]) / quantity
+				self.ingredients_dic[ingr] = quantity
+
+		first        = len(self.recipes)
+		self.recipes = list(self.recipes) + list(recipes)
+
+		for recipe_id, recipe in enumerate(recipes, first):
+			self.recipes_dic[recipe_id].append( recipe.name )
+
+		# Points not created yet will use the new ingredients anyway
+		if self.points is not None:
+			if (factors != 1.0).any():
+				self.points.rescale(factors)
+			points = table.points(self.ingredient_ids, self.ingredients_dic, len(self.ingredients))
+			self.points.append(points, len(self.ingredients))
+
+			if self.index is not None:
+				self.index.add([recipe.name for recipe in recipes])
+
+		return range(first, len(self.recipes))
 
-		dic = {}
 
-		for recipe in recipes:
+	def remove_recipes(self, ids):
+		""" Stops recommending the recipes with the given ids. The ids of
+		    the other recipes and the max quantities do not change """
 
-			# Rank the ingredients
-			ranked_ingredients = recipe.rank_ingredients()
+		for recipe_id in ids:
+			self.removed.add(recipe_id)
+			self.recipes_dic.pop(recipe_id, None)
 
-			for ingredient in recipe.ingredients:
+		if self.index is not None:
+			self.index.remove(ids)
 
-				ingredient_name = ingredient.name
 
-				if ingredient_name != "undifined":
-					if ingredient_name in dic:
-						if ingredient.quantity > dic[ingredient_name]:
-							dic[ingredient_name] = ingredient.quantity
-					else:
-						dic[ingredient_name] = ingredient.quantity
+	def get_recipes(self):
+		""" Return the dictionary of recipes """
 
-		return dic
+		return self.recipes_dic
+
+
+	def extract_ingredients(self, recipes):
+		""" Creates a dictionary with the ingredients found in the given recipes 
+		    keeping the maximum quantity found for each ingredient to normalize later.
+		    The quantities are merged per recipe and in cups, as rank_ingredients
+		    does, but the recipes are not modified """
+
+		return IngredientTable(recipes).max_quantities()
 
 
 	def read_query(self, file_name):
@@ -80,56 +158,156 @@ class Recommender:
 		return ingredients
 
 
+	def read_queries(self, file_name):
+		""" Reads many ingredient lists from a file, one per line with the
+		    ingredients separated by commas. Empty lines are skipped """
+
+		queries = []
+
+		with open(file_name, 'r') as f:
+			for line in f:
+				ingredients = {}
+				for ingr in line.rstrip('\n').split(','):
+					ingr = ingr.strip()
+					if ingr != "":
+						ingredients[ingr.lower()] = float(1)
+				if len(ingredients) > 0:
+					queries.append(ingredients)
+
+		return queries
+
+
 	def _create_point(self, names, query):
-		""" Creates a point of ingredients' quantity for the given recipe """
+		""" Creates a sparse point of ingredients' quantity for the given recipe.
+		    Only the known ingredients of the recipe are stored """
 
 		point = []
 
-		for ingr in self.ingredients :
+		for ingr in names:
 
 			# Save quantity of ingredient in current recipe
-			if ingr in names:
+			if ingr in self.ingredient_ids:
 				if not query:
 					normalized = names[ingr] / self.ingredients_dic[ingr]
-					point.append( normalized )
+					point.append( (self.ingredient_ids[ingr], normalized) )
 				else: # Put max quantity to requested ingredient
-					point.append( float(1) )
-				#point.append(float(1))
-			else:
-				point.append(float(0))
+					point.append( (self.ingredient_ids[ingr], float(1)) )
+
+		point.sort()
 
-		return tuple(point)
+		return SparseVector([i for i, v in point], [v for i, v in point], len(self.ingredients))
 
 
 
 	def create_points(self):
-		""" Create the points that represent each recipe """
+		""" Create the points that represent each recipe.
+		    Point i is the row i of the returned SparsePoints """
+
+		self.recipes_dic = defaultdict(list)
+
+		for recipe_id, recipe in enumerate(self.recipes):
 
-		points = []
+			# Save a dictionary of recipes according to their ids
+			if recipe_id not in self.removed:
+				self.recipes_dic[recipe_id].append( recipe.name )
 
-		for recipe in self.recipes:
+		with instrumentation.timer("points.table"):
+			table = IngredientTable(self.recipes)
 
-			names        = recipe.name_ingredients()
-			recipe_point = self._create_point(names, query=False)
-			points.append(recipe_point)
+		with instrumentation.timer("points.conversion"):
+			merged = table.merged()
 
-			# Save a dictionary of recipes according to these points
-			self.recipes_dic[recipe_point].append( recipe.name )
+		with instrumentation.timer("points.build"):
+			return table.points(self.ingredient_ids, self.ingredients_dic, len(self.ingredients), merged)
 
-		return points
 
+	def _create_index(self, points):
+		""" Creates the nearest neighbour index of the recipe points.
+		    Uses a KD-Tree when it can prune, brute force otherwise,
+		    MinHash LSH in approximate mode or the posting lists
+		    of the ingredients when pruning """
 
-	def _create_kdtree(self):
-		""" Creates the KDTree of ingredients """
+		if self.approximate is not None:
+			return MinHashLSHIndex(points, **self.approximate)
+		if self.min_shared is not None:
+			return InvertedIndex(points, self.min_shared)
 
-		#tree = kdtree.create(dimensions = len(ingredients))
+		return create_index(points)
+
+
+	def set_approximate(self, bands=16, rows=4, seed=0):
+		""" Uses approximate search from now on. More bands give a better
+		    recall, more rows faster queries with fewer candidates """
+
+		self.approximate = dict(bands=bands, rows=rows, seed=seed)
+		self.min_shared  = None
+		self.index       = None
+
+
+	def set_pruning(self, min_shared=1):
+		""" Only scores the recipes sharing at least min_shared ingredients
+		    with the query. With 1 the results are the exact ones """
+
+		self.approximate = None
+		self.min_shared  = min_shared
+		self.index       = None
+
+
+	def set_exact(self):
+		""" Uses exhaustive exact search from now on """
+
+		self.approximate = None
+		self.min_shared  = None
+		self.index       = None
+
+
+	def measure_recall(self, queries, k, sample=100, seed=0):
+		""" Fraction of the exact k nearest recipes that the current index
+		    finds, averaged over a random sample of the ingredient lists """
+
+		rand   = random.Random(seed)
+		chosen = rand.sample(queries, min(sample, len(queries)))
+		points = [self._create_point(ingredients, query=True) for ingredients in chosen]
+
+		exact = create_index(self.get_points())
+		if len(self.removed) > 0:
+			exact.remove(self.removed)
+
+		return measure_recall(self.get_index().search, exact, points, k)
+
+
+	def get_points(self):
+		""" Returns the points of the current recipes, creating them if needed """
+
+		if self.points is None:
+			self.points = self.create_points()
+
+		return self.points
+
+
+	def build_index(self):
+		""" Builds the recommendation index over the current recipes """
 
 		# For each recipe we create an array that indicates
-		# if the recipe contains 1 a given ingredient or not 0
-		# --> each array becomes a point in the tree
-		points = self._create_points()
+		# the quantity of each known ingredient on that recipe
+		# --> each array becomes a point in the index
+		points = self.get_points()
+		names  = [recipe.name for recipe in self.recipes]
+
+		with instrumentation.timer("index.build"):
+			self.index = RecommendationIndex(points, names, self._create_index(points))
+		self.index.remove(self.removed)
+
+		return self.index
 
-		return kdtree.create(points[:])
+
+	def get_index(self):
+		""" Returns the recommendation index, building it if needed """
+
+		if self.index is None:
+			self.build_index()
+
+		return self.index
 
 
 	def _remove_duplicates(self, l):
@@ -143,27 +321,14 @@ class Recommender:
 
 		return new_list
 
-	def knn(self, tree, point, k):
-		""" Return a list with the k nearest neighbours for given point """
-
-		neighbours         = defaultdict(list)
-		nearest_neighbours = []
+	def knn(self, index, point, k):
+		""" Return a list with the ids of the k nearest neighbours for given point """
 
-		for node in list(tree.inorder()):
-			dist = node.dist(point)
-			neighbours[dist].append(node.data)
-
-		in_order = sorted(neighbours)
-
-		for elem in in_order[:k]:
-			for node in neighbours[elem]:
-				nearest_neighbours.append(node)
-
-		return nearest_neighbours
+		return [i for dist, i in index.query(point, k)]
 
 
 	def point_recipe(self, clusters):
-		""" Translates points in clusters with corresponding recipe name """
+		""" Translates point ids in clusters with corresponding recipe name """
 
 		recipe_clusters = defaultdict(list)
 		c = 0
@@ -180,24 +345,29 @@ class Recommender:
 	def get_recommendation(self, ingredients, k):
 		""" Returns a list of k recommended recipes given some ingredients"""
 
-		# Creates the KDTree of ingredients:
-		# For each recipe we create an array that indicates
-		# the quantity of each known ingredient on that recipe
-		# --> each array becomes a point in the tree
-		points = self.create_points()
-		tree   = kdtree.create(points)
+		# The index is only built once for the current recipes
+		index = self.get_index()
 
 		# Create a point according to selected ingredients
-		point  = self._create_point(ingredients, query=True)
+		point = self._create_point(ingredients, query=True)
 
 		# Get matching recipes
-		result       = self.knn(tree, point, k) #tree.search_knn(point, k)
-		best_recipes = []
-		for point in result:
-			for r in self.recipes_dic[point]:
-				best_recipes.append(r)
+		instrumentation.count("knn.queries")
+		with instrumentation.timer("knn.search"):
+			return index.query(point, k)
+
+
+	def get_recommendations(self, queries, k, block_size=256, threads=1):
+		""" Returns the k recommended recipes of each ingredient list in queries.
+		    The queries are searched together in blocks of block_size,
+		    using threads threads """
+
+		index  = self.get_index()
+		points = [self._create_point(ingredients, query=True) for ingredients in queries]
 
-		return self._remove_duplicates(best_recipes)
+		instrumentation.count("knn.queries", len(points))
+		with instrumentation.timer("knn.search"):
+			return index.query_batch(points, k, block_size, threads)
 
 
 	#h
@@ -0,0 +1,113 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# recommendation_index.py : defines the RecommendationIndex
+#
+# A RecommendationIndex is built once from the recipe
+# points and owns the point matrix, the point id -> recipe
+# name mapping and the nearest neighbour search
+# structure, so a query only has to build its own point.
+# Recipes can be added and removed without building the
+# index again: the search skips the removed points.
+#
+######################################################
+
+# Project Modules
+from knn_index import create_index, batch_query
+
+
+class RecommendationIndex:
+	""" Prebuilt recipe search index """
+
+	def __init__(self, points, names, search=None):
+		""" Point i (row i of the SparsePoints) is the recipe called names[i].
+		    names can be any indexable sequence, such as a NameTable.
+		    search is a nearest neighbour index of the points, exact by default """
+
+		self.points  = points
+		self.recipes = names
+		self.search  = search if search is not None else create_index(points)
+		self.removed = set()
+
+
+	def __len__(self):
+
+		return len(self.points) - len(self.removed)
+
+
+	def add(self, names):
+		""" Follows the points appended to (or rescaled in) the SparsePoints.
+		    names are the recipe names of the new points, in order """
+
+		self.recipes.extend(names)
+
+		# The dense indexes copied the points: build them again
+		if hasattr(self.search, "update"):
+			self.search.update()
+		else:
+			self.search = create_index(self.points)
+			if len(self.removed) > 0:
+				self.search.remove(self.removed)
+
+
+	def remove(self, ids):
+		""" Stops returning the given point ids. The points stay in place
+		    and the search skips them """
+
+		ids = set(ids) - self.removed
+		self.removed.update(ids)
+
+		if hasattr(self.search, "remove"):
+			self.search.remove(ids)
+
+
+	def _extra(self):
+		""" Neighbours to ask for in addition to k: a search that cannot
+		    skip the removed points may return them all """
+
+		return 0 if hasattr(self.search, "remove") else len(self.removed)
+
+
+	def _live(self, found, k):
+		""" The first k ids of a query result that were not removed.
+		    A search with fewer than k live points returns removed ones """
+
+		return [i for dist, i in found if i not in self.removed][:k]
+
+
+	def neighbours(self, point, k):
+		""" Returns the ids of the k nearest points """
+
+		return self._live(self.search.query(point, k + self._extra()), k)
+
+
+	def _names(self, ids):
+		""" Recipe names of the given point ids, without duplicates """
+
+		best_recipes = []
+
+		for i in ids:
+			name = self.recipes[i]
+			if name not in best_recipes:
+				best_recipes.append(name)
+
+		return best_recipes
+
+
+	def query(self, point, k):
+		""" Returns the names of the recipes of the k nearest points """
+
+		return self._names(self.neighbours(point, k))
+
+
+	def query_batch(self, points, k, block_size=256, threads=1):
+		""" Returns the query results of many points, in order """
+
+		results = batch_query(self.search, points, k + self._extra(), block_size, threads)
+
+		return [self._names(self._live(result, k)) for result in results]
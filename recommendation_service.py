@@ -0,0 +1,412 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# recommendation_service.py : local HTTP recommendation
+#                             service
+#
+# A RecommendationService answers the recommendation
+# requests of many threads with one recommender. The
+# requests that arrive within window seconds of each other
+# are searched together with one get_recommendations call,
+# one vectorized kNN pass, by a single batching thread.
+# At most max_pending requests wait at the same time, the
+# others are rejected at once. reload() swaps in a new
+# corpus snapshot between two batches: the batch in
+# progress ends on the old one and no request is lost.
+#
+# serve() puts it behind a threaded HTTP server:
+#   POST /recommend  ingredients, one per line (as in
+#                    read_query) or JSON {"ingredients":
+#                    [...], "k": 10}
+#   POST /reload     loads the snapshot again, or the one
+#                    of JSON {"path": ...}
+#   GET  /metrics    latency and throughput
+#   GET  /health
+#
+#   python recommendation_service.py SNAPSHOT --port 8080
+#
+# where SNAPSHOT was written by shared_points.export_shared.
+#
+######################################################
+
+# Python Modules
+import sys
+import json
+import argparse
+import threading
+from Queue import Queue, Empty
+from timeit import default_timer
+from collections import deque, defaultdict
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+# Project Modules
+import instrumentation
+
+
+class ServiceBusy(Exception):
+	""" Too many requests are already waiting """
+
+
+class ServiceTimeout(Exception):
+	""" The request was not answered in time """
+
+
+class _Request(object):
+	""" A query waiting for its batch """
+
+	__slots__ = ("ingredients", "k", "start", "done", "result", "error")
+
+	def __init__(self, ingredients, k):
+
+		self.ingredients = ingredients
+		self.k           = k
+		self.start       = default_timer()
+		self.done        = threading.Event()
+		self.result      = None
+		self.error       = None
+
+
+class ServiceMetrics:
+	""" Request counters and the latencies of the last requests """
+
+	def __init__(self, keep=10000):
+
+		self.lock      = threading.Lock()
+		self.started   = default_timer()
+		self.counts    = defaultdict(int) # requests, rejected, timeouts, errors, batches, reloads
+		self.batched   = 0                # Requests answered by the batches
+		self.latencies = deque(maxlen=keep)
+
+
+	def add(self, name, n=1):
+
+		with self.lock:
+			self.counts[name] += n
+
+
+	def answered(self, requests):
+		""" Records one batch and the latency of its requests """
+
+		now = default_timer()
+
+		with self.lock:
+			self.counts["batches"] += 1
+			self.batched += len(requests)
+			self.latencies.extend(now - request.start for request in requests)
+
+
+	def report(self):
+		""" Counters, mean batch size, throughput and latency percentiles """
+
+		with self.lock:
+			counts    = dict(self.counts)
+			latencies = sorted(self.latencies)
+			uptime    = default_timer() - self.started
+			batched   = self.batched
+
+		def percentile(p):
+			if len(latencies) == 0:
+				return None
+			return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+		return {
+			"counts"        : counts,
+			"uptime"        : uptime,
+			"throughput"    : batched / uptime if uptime > 0 else 0.0,
+			"mean_batch"    : float(batched) / counts["batches"] if counts.get("batches") else 0.0,
+			"latency_p50"   : percentile(0.5),
+			"latency_p95"   : percentile(0.95),
+			"latency_p99"   : percentile(0.99),
+			"latency_max"   : latencies[-1] if len(latencies) > 0 else None
+		}
+
+
+class RecommendationService:
+	""" Micro-batching front of a Recommender (or SharedIndex) """
+
+	def __init__(self, recommender, k=10, window=0.005, max_batch=256, max_pending=1024, timeout=30.0, loader=None):
+		""" Requests are batched for up to window seconds or max_batch
+		    requests. loader(path) returns a new recommender for reload,
+		    path None meaning the current snapshot """
+
+		self.recommender = recommender
+		self.k           = k
+		self.window      = window
+		self.max_batch   = max_batch
+		self.timeout     = timeout
+		self.loader      = loader
+		self.metrics     = ServiceMetrics()
+
+		self.queue       = Queue()
+		self.pending     = threading.BoundedSemaphore(max_pending)
+		self.reload_lock = threading.Lock()
+		self.running     = True
+
+		self._warm(recommender)
+
+		self.batcher = threading.Thread(target=self._run, name="recommendation-batcher")
+		self.batcher.daemon = True
+		self.batcher.start()
+
+
+	def _warm(self, recommender):
+		""" Builds the index before the recommender serves any request """
+
+		if hasattr(recommender, "get_index"):
+			recommender.get_index()
+
+
+	def recommend(self, ingredients, k=None):
+		""" Recipe names recommended for the ingredients (a dictionary
+		    as read_query returns or a list of names). Blocks until the
+		    batch of the request is searched """
+
+		if not self.pending.acquire(False):
+			self.metrics.add("rejected")
+			raise ServiceBusy("too many pending requests")
+
+		try:
+			self.metrics.add("requests")
+			instrumentation.count("service.requests")
+
+			request = _Request(ingredients, self.k if k is None else k)
+			self.queue.put(request)
+
+			if not request.done.wait(self.timeout):
+				self.metrics.add("timeouts")
+				raise ServiceTimeout("no answer after %.1fs" % self.timeout)
+			if request.error is not None:
+				raise request.error
+
+			return request.result
+
+		finally:
+			self.pending.release()
+
+
+	def _next_batch(self):
+		""" Waits for a request, then takes the ones arriving within window """
+
+		try:
+			batch = [self.queue.get(True, 0.1)]
+		except Empty:
+			return []
+
+		deadline = default_timer() + self.window
+
+		while len(batch) < self.max_batch:
+			left = deadline - default_timer()
+			try:
+				batch.append(self.queue.get(left > 0, max(left, 0)))
+			except Empty:
+				break
+
+		return batch
+
+
+	def _run(self):
+
+		while self.running:
+			batch = self._next_batch()
+			if len(batch) > 0:
+				self._answer(batch)
+
+
+	def _answer(self, batch):
+		""" One get_recommendations call per distinct k of the batch """
+
+		recommender = self.recommender # Keeps this snapshot for the whole batch
+
+		by_k = defaultdict(list)
+		for request in batch:
+			by_k[request.k].append(request)
+
+		with instrumentation.timer("service.batch"):
+			for k, requests in by_k.items():
+				try:
+					results = recommender.get_recommendations([r.ingredients for r in requests], k)
+					for request, result in zip(requests, results):
+						request.result = result
+				except Exception as e:
+					self.metrics.add("errors")
+					for request in requests:
+						request.error = e
+
+		self.metrics.answered(batch)
+		for request in batch:
+			request.done.set()
+
+
+	def reload(self, path=None):
+		""" Loads a new snapshot with loader(path) and serves it from the
+		    next batch on. The old one keeps serving while it loads """
+
+		if self.loader is None:
+			raise ValueError("The service has no snapshot loader")
+
+		with self.reload_lock:
+			recommender = self.loader(path)
+			self._warm(recommender)
+			self.recommender = recommender
+			self.metrics.add("reloads")
+
+
+	def close(self):
+		""" Stops the batching thread once the waiting requests are answered """
+
+		self.running = False
+		self.batcher.join()
+
+		while not self.queue.empty():
+			self._answer(self._next_batch())
+
+
+def parse_ingredients(body, content_type=""):
+	""" Ingredient dictionary and k (None if not given) of a request body:
+	    JSON {"ingredients": [...], "k": k} or a JSON list, or one
+	    ingredient per line as in read_query """
+
+	k = None
+
+	if "json" in content_type or body.lstrip()[:1] in ("{", "["):
+		data = json.loads(body)
+		if isinstance(data, dict):
+			k    = data.get("k")
+			data = data.get("ingredients", [])
+		if k is not None and (not isinstance(k, int) or k < 1):
+			raise ValueError("k must be a positive integer")
+		names = [unicode(name) for name in data]
+	else:
+		names = body.split("\n")
+
+	ingredients = {}
+	for name in names:
+		name = name.strip().lower()
+		if name != "":
+			ingredients[name.encode("utf-8") if isinstance(name, unicode) else name] = float(1)
+
+	return ingredients, k
+
+
+class _Handler(BaseHTTPRequestHandler):
+	""" HTTP requests of the service (self.server.service) """
+
+	def _reply(self, status, data):
+
+		text = json.dumps(data)
+
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(text)))
+		self.end_headers()
+		self.wfile.write(text)
+
+
+	def _body(self):
+
+		return self.rfile.read(int(self.headers.getheader("Content-Length") or 0))
+
+
+	def do_GET(self):
+
+		if self.path == "/metrics":
+			self._reply(200, self.server.service.metrics.report())
+		elif self.path == "/health":
+			self._reply(200, {"status": "ok"})
+		else:
+			self._reply(404, {"error": "not found"})
+
+
+	def do_POST(self):
+
+		if self.path == "/recommend":
+			try:
+				ingredients, k = parse_ingredients(self._body(), self.headers.getheader("Content-Type") or "")
+			except (ValueError, TypeError) as e:
+				return self._reply(400, {"error": str(e)})
+
+			try:
+				self._reply(200, {"recipes": self.server.service.recommend(ingredients, k)})
+			except ServiceBusy as e:
+				self._reply(503, {"error": str(e)})
+			except ServiceTimeout as e:
+				self._reply(504, {"error": str(e)})
+			except Exception as e:
+				self._reply(500, {"error": str(e)})
+
+		elif self.path == "/reload":
+			try:
+				body = self._body()
+				path = json.loads(body).get("path") if body.strip() != "" else None
+				self.server.service.reload(path)
+				self._reply(200, {"status": "reloaded"})
+			except Exception as e:
+				self._reply(500, {"error": str(e)})
+
+		else:
+			self._reply(404, {"error": "not found"})
+
+
+	def log_message(self, format, *args):
+
+		pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+	daemon_threads      = True
+	allow_reuse_address = True
+	request_queue_size  = 128 # Listen backlog, 5 refuses bursts of clients
+
+
+def serve(service, host="127.0.0.1", port=8080):
+	""" HTTP server of the service, one thread per connection.
+	    Call serve_forever() on it """
+
+	server = _ThreadingHTTPServer((host, port), _Handler)
+	server.service = service
+
+	return server
+
+
+def main(argv=None):
+
+	parser = argparse.ArgumentParser(description="Local HTTP recipe recommendation service")
+	parser.add_argument("snapshot", help="directory written by shared_points.export_shared")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8080)
+	parser.add_argument("-k", type=int, default=10, help="recommendations per request by default")
+	parser.add_argument("--window", type=float, default=0.005, help="seconds to gather a batch")
+	parser.add_argument("--max-batch", type=int, default=256)
+	parser.add_argument("--max-pending", type=int, default=1024, help="requests waiting before rejecting")
+	args = parser.parse_args(argv)
+
+	from shared_points import SharedIndex
+
+	def loader(path):
+		return SharedIndex(path or args.snapshot)
+
+	service = RecommendationService(loader(None), args.k, args.window, args.max_batch, args.max_pending,
+	                                loader=loader)
+	server  = serve(service, args.host, args.port)
+
+	sys.stderr.write("serving %s on http://%s:%d\n" % (args.snapshot, args.host, args.port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.close()
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,111 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# shared_points.py : recipe points shared by processes
+#
+# export_shared writes the point matrix, the recipe id ->
+# name table and the ingredients of a Recommender once.
+# Every worker process then creates a SharedIndex that
+# memory maps these files: the operating system keeps one
+# copy of the corpus in memory for all the workers.
+#
+######################################################
+
+# Python Modules
+import os
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from sparse_points import SparseVector, SparsePoints
+from recommendation_index import RecommendationIndex
+
+
+class NameTable:
+	""" Memory mapped table of utf-8 strings, indexed by id """
+
+	def __init__(self, path, name, mmap_mode="r"):
+
+		self.offsets = np.load(os.path.join(path, name + "_offsets.npy"), mmap_mode=mmap_mode)
+		self.text    = np.load(os.path.join(path, name + "_text.npy"), mmap_mode=mmap_mode)
+
+
+	@staticmethod
+	def save(path, name, strings):
+		""" Writes the strings as one byte array and their offsets """
+
+		encoded = [s.encode("utf-8") if isinstance(s, unicode) else s for s in strings]
+		offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum([len(s) for s in encoded])
+
+		np.save(os.path.join(path, name + "_offsets.npy"), offsets)
+		np.save(os.path.join(path, name + "_text.npy"), np.frombuffer(b"".join(encoded) or b"\0", dtype=np.uint8))
+
+
+	def __len__(self):
+
+		return len(self.offsets) - 1
+
+
+	def __getitem__(self, i):
+
+		if i < 0 or i >= len(self):
+			raise IndexError(i)
+
+		return self.text[self.offsets[i]:self.offsets[i + 1]].tostring().decode("utf-8")
+
+
+	def __iter__(self):
+
+		for i in range(len(self)):
+			yield self[i]
+
+
+def export_shared(path, recommender):
+	""" Writes the points, recipe names and ingredients of the recommender """
+
+	if not os.path.isdir(path):
+		os.makedirs(path)
+
+	recommender.get_points().save(path)
+	NameTable.save(path, "names", [recipe.name for recipe in recommender.recipes])
+	NameTable.save(path, "ingredients", recommender.ingredients)
+
+
+class SharedIndex:
+	""" Recommendation index attached to the files of export_shared """
+
+	def __init__(self, path):
+
+		self.ingredients    = NameTable(path, "ingredients")
+		self.ingredient_ids = dict((ingr, i) for i, ingr in enumerate(self.ingredients))
+		self.points         = SparsePoints.load(path, len(self.ingredients))
+		self.index          = RecommendationIndex(self.points, NameTable(path, "names"))
+
+
+	def _create_point(self, names):
+		""" Query point: max quantity for each requested known ingredient """
+
+		indices = sorted(self.ingredient_ids[ingr] for ingr in names if ingr in self.ingredient_ids)
+
+		return SparseVector(indices, [float(1)] * len(indices), len(self.ingredients))
+
+
+	def get_recommendation(self, ingredients, k):
+		""" Returns a list of k recommended recipes given some ingredients """
+
+		return self.index.query(self._create_point(ingredients), k)
+
+
+	def get_recommendations(self, queries, k, block_size=256, threads=1):
+		""" Returns the k recommended recipes of each ingredient list in queries """
+
+		points = [self._create_point(ingredients) for ingredients in queries]
+
+		return self.index.query_batch(points, k, block_size, threads)
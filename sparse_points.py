@@ -0,0 +1,375 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# sparse_points.py : defines the SparseVector and
+#                    SparsePoints classes
+#
+# A recipe only uses a handful of the known ingredients,
+# so its point is stored as the indices and values of the
+# non zero dimensions. SparsePoints keeps the points of a
+# whole corpus as one CSR matrix (indptr, indices, data),
+# and each point is identified by its row number.
+#
+######################################################
+
+# Python Modules
+import os
+
+# NumPy Modules
+import numpy as np
+
+
+class SparseVector:
+	""" Sparse point: sorted indices and values of the non zero dimensions """
+
+	def __init__(self, indices, values, dimensions):
+
+		self.indices    = np.asarray(indices, dtype=np.int64)
+		self.values     = np.asarray(values, dtype=float)
+		self.dimensions = dimensions
+
+
+	def __len__(self):
+
+		return self.dimensions
+
+
+	def sq_norm(self):
+		""" Squared euclidean norm """
+
+		return float(np.dot(self.values, self.values))
+
+
+	def to_dense(self):
+		""" Returns the point as a dense float array """
+
+		dense = np.zeros(self.dimensions)
+		dense[self.indices] = self.values
+
+		return dense
+
+
+def dense_vector(point, dimensions):
+	""" Returns a dense float array for a SparseVector or any sequence """
+
+	if isinstance(point, SparseVector):
+		return point.to_dense()
+
+	return np.asarray(point, dtype=float).reshape(dimensions)
+
+
+class SparsePoints:
+	""" CSR matrix of points """
+
+	def __init__(self, indptr, indices, data, dimensions):
+
+		self.indptr     = np.asarray(indptr, dtype=np.int64)
+		self.indices    = np.asarray(indices, dtype=np.int64)
+		self.data       = np.asarray(data, dtype=float)
+		self.dimensions = dimensions
+
+		self._rows     = None
+		self._sq_norms = None
+		self._columns  = None
+
+
+	@classmethod
+	def from_vectors(cls, vectors, dimensions):
+		""" Stacks a list of SparseVector into one matrix """
+
+		indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+		for i, v in enumerate(vectors):
+			indptr[i + 1] = indptr[i] + len(v.indices)
+
+		if len(vectors) > 0:
+			indices = np.concatenate([v.indices for v in vectors])
+			data    = np.concatenate([v.values for v in vectors])
+		else:
+			indices = np.zeros(0, dtype=np.int64)
+			data    = np.zeros(0)
+
+		return cls(indptr, indices, data, dimensions)
+
+
+	@classmethod
+	def load(cls, path, dimensions, mmap_mode="r"):
+		""" Memory maps the arrays written by save. Processes loading the
+		    same files share their pages instead of copying the points """
+
+		def array(name):
+			return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+		points = cls(array("indptr"), array("indices"), array("data"), dimensions)
+
+		# Also attach the derived arrays when they were saved
+		if os.path.exists(os.path.join(path, "rows.npy")):
+			points._rows     = array("rows")
+			points._sq_norms = array("sq_norms")
+		if os.path.exists(os.path.join(path, "col_indptr.npy")):
+			points._columns  = (array("col_indptr"), array("col_rows"), array("col_data"))
+
+		return points
+
+
+	def save(self, path):
+		""" Writes the CSR arrays, and the row ids and norms, as .npy files """
+
+		np.save(os.path.join(path, "indptr.npy"), self.indptr)
+		np.save(os.path.join(path, "indices.npy"), self.indices)
+		np.save(os.path.join(path, "data.npy"), self.data)
+		np.save(os.path.join(path, "rows.npy"), self.row_ids())
+		np.save(os.path.join(path, "sq_norms.npy"), self.sq_norms())
+
+		col_indptr, col_rows, col_data = self.columns()
+		np.save(os.path.join(path, "col_indptr.npy"), col_indptr)
+		np.save(os.path.join(path, "col_rows.npy"), col_rows)
+		np.save(os.path.join(path, "col_data.npy"), col_data)
+
+
+	def __len__(self):
+
+		return len(self.indptr) - 1
+
+
+	def append(self, vectors, dimensions=None):
+		""" Adds the SparseVectors (or SparsePoints) as the last points, in
+		    place. dimensions can grow: the existing points are zero on the
+		    new dimensions. The cached norms and columns are extended """
+
+		dimensions = self.dimensions if dimensions is None else dimensions
+		if isinstance(vectors, SparsePoints):
+			new = SparsePoints(vectors.indptr, vectors.indices, vectors.data, dimensions)
+		else:
+			new = SparsePoints.from_vectors(vectors, dimensions)
+		n, nnz     = len(self), self.nnz()
+
+		if self._columns is not None:
+			col_indptr, col_rows, col_data = self._columns
+
+			# Each new value goes at the end of its column (new columns after all)
+			order = np.argsort(new.indices, kind="mergesort")
+			cols  = new.indices[order]
+			at    = col_indptr[np.minimum(cols + 1, self.dimensions)]
+
+			col_rows   = np.insert(col_rows, at, new.row_ids()[order] + n)
+			col_data   = np.insert(col_data, at, new.data[order])
+			col_indptr = np.concatenate([col_indptr, np.repeat(col_indptr[-1:], dimensions - self.dimensions)])
+			col_indptr = col_indptr + np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=dimensions))])
+
+			self._columns = (col_indptr.astype(np.int64), col_rows, col_data)
+
+		if self._rows is not None:
+			self._rows = np.concatenate([self._rows, new.row_ids() + n])
+		if self._sq_norms is not None:
+			self._sq_norms = np.concatenate([self._sq_norms, new.sq_norms()])
+
+		self.indptr     = np.concatenate([self.indptr, new.indptr[1:] + nnz])
+		self.indices    = np.concatenate([self.indices, new.indices])
+		self.data       = np.concatenate([self.data, new.data])
+		self.dimensions = dimensions
+
+
+	def rescale(self, factors):
+		""" Multiplies every dimension c of all the points by factors[c], in place """
+
+		factors   = np.asarray(factors, dtype=float)
+		self.data = self.data * factors[self.indices]
+
+		if self._columns is not None:
+			col_indptr, col_rows, col_data = self._columns
+			cols = np.repeat(np.arange(len(col_indptr) - 1), np.diff(col_indptr))
+			self._columns = (col_indptr, col_rows, col_data * factors[cols])
+
+		self._sq_norms = None
+
+
+	def nnz(self):
+		""" Number of stored values """
+
+		return len(self.data)
+
+
+	def slice(self, start, end):
+		""" Returns the points start..end-1 as SparsePoints sharing the arrays """
+
+		end    = min(end, len(self))
+		indptr = self.indptr[start:end + 1]
+		first  = indptr[0]
+
+		return SparsePoints(indptr - first, self.indices[first:indptr[-1]], self.data[first:indptr[-1]], self.dimensions)
+
+
+	def row(self, i):
+		""" Returns point i as a SparseVector """
+
+		start, end = self.indptr[i], self.indptr[i + 1]
+
+		return SparseVector(self.indices[start:end], self.data[start:end], self.dimensions)
+
+
+	def row_ids(self):
+		""" Row number of every stored value """
+
+		if self._rows is None:
+			self._rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+		return self._rows
+
+
+	def sq_norms(self):
+		""" Squared euclidean norm of every point """
+
+		if self._sq_norms is None:
+			self._sq_norms = np.bincount(self.row_ids(), weights=self.data * self.data, minlength=len(self))
+
+		return self._sq_norms
+
+
+	def columns(self):
+		""" The same matrix by columns (CSC): (col_indptr, rows, data).
+		    The rows of column c are the points that use dimension c """
+
+		if self._columns is None:
+			order      = np.argsort(self.indices, kind="mergesort")
+			counts     = np.bincount(self.indices, minlength=self.dimensions)
+			col_indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+			self._columns = (col_indptr, self.row_ids()[order], self.data[order])
+
+		return self._columns
+
+
+	def dot_vectors(self, vectors):
+		""" Products of every point with each SparseVector (m, n).
+		    Only the columns used by the vectors are read """
+
+		col_indptr, col_rows, col_data = self.columns()
+
+		n      = len(self)
+		result = np.zeros(len(vectors) * n)
+
+		for q, vector in enumerate(vectors):
+			for c, value in zip(vector.indices.tolist(), vector.values.tolist()):
+				start, end = col_indptr[c], col_indptr[c + 1]
+				result[q * n + col_rows[start:end]] += value * col_data[start:end]
+
+		return result.reshape(len(vectors), n)
+
+
+	def dot_rows(self, ids, q):
+		""" Products of the given points with the dense vector q """
+
+		ids     = np.asarray(ids, dtype=np.int64)
+		starts  = self.indptr[ids]
+		lengths = self.indptr[ids + 1] - starts
+		result  = np.zeros(len(ids))
+
+		if lengths.sum() == 0:
+			return result
+
+		# Positions of the values of the points, one after the other
+		offsets   = np.repeat(np.cumsum(lengths) - lengths, lengths)
+		positions = np.repeat(starts, lengths) + np.arange(lengths.sum()) - offsets
+		products  = self.data[positions] * q[self.indices[positions]]
+
+		nonempty = lengths > 0
+		result[nonempty] = np.add.reduceat(products, (np.cumsum(lengths) - lengths)[nonempty])
+
+		return result
+
+
+	def dot(self, other):
+		""" Product with a dense vector (d,) -> (n,) or matrix (m, d) -> (n, m) """
+
+		other = np.asarray(other, dtype=float)
+		rows  = self.row_ids()
+
+		if other.ndim == 1:
+			return np.bincount(rows, weights=self.data * other[self.indices], minlength=len(self))
+
+		# Sum the products of each row with one reduceat over the values
+		contrib  = other[:, self.indices] * self.data
+		result   = np.zeros((other.shape[0], len(self)))
+		nonempty = np.diff(self.indptr) > 0
+		if self.nnz() > 0:
+			result[:, nonempty] = np.add.reduceat(contrib, self.indptr[:-1][nonempty], axis=1)
+
+		return result.T
+
+
+	def sq_distances(self, point):
+		""" Squared distance from every point to the given point """
+
+		if isinstance(point, SparseVector):
+			return self.sq_distances_vectors([point])[0]
+
+		q    = dense_vector(point, self.dimensions)
+		dist = self.sq_norms() - 2.0 * self.dot(q) + np.dot(q, q)
+		np.maximum(dist, 0.0, out=dist) # Rounding may give tiny negative values
+
+		return dist
+
+
+	def sq_distances_vectors(self, vectors):
+		""" Squared distance from every point to each SparseVector (m, n) """
+
+		q_norms = np.array([v.sq_norm() for v in vectors])
+		dist    = q_norms[:, None] - 2.0 * self.dot_vectors(vectors) + self.sq_norms()[None, :]
+		np.maximum(dist, 0.0, out=dist)
+
+		return dist
+
+
+	def dense_rows(self, ids):
+		""" Returns the given points as a dense (len(ids), d) array """
+
+		dense = np.zeros((len(ids), self.dimensions))
+		for r, i in enumerate(ids):
+			start, end = self.indptr[i], self.indptr[i + 1]
+			dense[r, self.indices[start:end]] = self.data[start:end]
+
+		return dense
+
+
+	def to_dense(self):
+		""" Returns all the points as a dense (n, d) array """
+
+		dense = np.zeros((len(self), self.dimensions))
+		dense[self.row_ids(), self.indices] = self.data
+
+		return dense
+
+
+	def sum_by_label(self, labels, k):
+		""" Sum of the points with each label (k, d) """
+
+		sums = np.zeros((k, self.dimensions))
+		np.add.at(sums, (np.asarray(labels)[self.row_ids()], self.indices), self.data)
+
+		return sums
+
+
+def pairwise_sq_distances(X, means, sq_norms=None):
+	""" Squared distance from every point of X (SparsePoints or dense
+	    (n, d) array) to every row of means: an (n, k) array """
+
+	means = np.asarray(means, dtype=float)
+
+	if isinstance(X, SparsePoints):
+		products = X.dot(means)
+		if sq_norms is None:
+			sq_norms = X.sq_norms()
+	else:
+		products = np.dot(X, means.T)
+		if sq_norms is None:
+			sq_norms = (X * X).sum(axis=1)
+
+	# |x - m|^2 = |x|^2 - 2 x.m + |m|^2
+	d = sq_norms[:, None] - 2.0 * products + (means * means).sum(axis=1)[None, :]
+	np.maximum(d, 0.0, out=d) # Rounding may give tiny negative values
+
+	return d
@@ -0,0 +1,62 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# test_lsh_index.py : band keys of the MinHashLSHIndex
+#
+#   python -m unittest discover -p "test_*.py"
+#
+######################################################
+
+# Python Modules
+import unittest
+
+# NumPy Modules
+import numpy as np
+
+# Project Modules
+from lsh_index import PRIME, MinHashLSHIndex
+from sparse_points import SparseVector, SparsePoints
+
+
+def _points(rows, dimensions):
+
+	return SparsePoints.from_vectors([SparseVector(r, [float(1)] * len(r), dimensions) for r in rows], dimensions)
+
+
+class BandKeysTest(unittest.TestCase):
+
+	def test_keys_follow_the_hash_with_many_rows(self):
+
+		points = _points([[0, 3, 5], [1, 2], [4, 5, 6, 7]], 8)
+
+		for rows in (3, 4, 6):
+			index = MinHashLSHIndex(points, bands=5, rows=rows, seed=1)
+			sigs  = index._signatures(points)
+			keys  = index._band_keys(sigs)
+
+			for p in range(len(points)):
+				for band in range(index.bands):
+					expected = 0 # Exact, with python integers
+					for r in range(rows):
+						expected = (expected * 1000003 + int(sigs[p, band * rows + r])) % PRIME
+					self.assertEqual(int(keys[p, band]), expected)
+
+			self.assertTrue((keys >= 0).all())
+
+
+	def test_same_ingredients_are_candidates(self):
+
+		points = _points([[0, 3, 5], [1, 2], [0, 3, 5], [4, 6]], 8)
+		index  = MinHashLSHIndex(points, bands=4, rows=4, seed=0)
+
+		found = index.candidates(SparseVector([0, 3, 5], [float(1)] * 3, 8))
+		self.assertEqual(sorted(found.tolist()), [0, 2])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,88 @@
+######################################################
+#
+# TUM Machine Learning
+# Final Project : Recipes Classification
+#
+# Author: Oriana Baldizan
+# Data:   February 2015
+#
+# test_serialization.py : pickling of the slotted classes
+#
+#   python -m unittest discover -p "test_*.py"
+#
+######################################################
+
+# Python Modules
+import os
+import pickle
+import cPickle
+import tempfile
+import unittest
+
+# Project Modules
+from ingredient import Ingredient
+from recipe import Recipe, SourceText
+
+
+class PicklingTest(unittest.TestCase):
+
+	def setUp(self):
+
+		element = "<pr>Mix the Flour.</pr>"
+		handle, self.path = tempfile.mkstemp(suffix=".xml")
+		with os.fdopen(handle, 'w') as f:
+			f.write("<recipe>" + element + "</recipe>")
+
+		self.source     = SourceText(self.path, 8, 8 + len(element))
+		self.ingredient = Ingredient("flour", "cup", 2.0, "sifted", "2 c flour; sifted")
+
+
+	def tearDown(self):
+
+		os.remove(self.path)
+
+
+	def _round_trips(self, obj):
+		""" obj pickled and unpickled with both modules and protocols 0 and 2 """
+
+		return [module.loads(module.dumps(obj, protocol)) for module in (pickle, cPickle) for protocol in (0, 2)]
+
+
+	def test_ingredient(self):
+
+		for copy in self._round_trips(self.ingredient):
+			self.assertEqual([getattr(copy, s) for s in Ingredient.__slots__],
+			                 [getattr(self.ingredient, s) for s in Ingredient.__slots__])
+
+
+	def test_source_text(self):
+
+		for copy in self._round_trips(self.source):
+			self.assertEqual((copy.path, copy.start, copy.end), (self.path, self.source.start, self.source.end))
+			self.assertEqual(copy.read(), "mix the flour.")
+
+
+	def test_recipe(self):
+
+		recipe = Recipe("pancakes", [self.ingredient], "mix and fry.")
+		recipe.rank_ingredients()
+
+		for copy in self._round_trips(recipe):
+			self.assertEqual(copy.name, "pancakes")
+			self.assertEqual(copy.cook_process, "mix and fry.")
+			self.assertTrue(copy.merged)
+			self.assertEqual([(i.name, i.unit, i.quantity) for i in copy.ingredients],
+			                 [(i.name, i.unit, i.quantity) for i in recipe.ingredients])
+
+
+	def test_recipe_with_lazy_process(self):
+
+		recipe = Recipe("pancakes", [self.ingredient], self.source)
+
+		for copy in self._round_trips(recipe):
+			self.assertTrue(isinstance(copy._process, SourceText))
+			self.assertEqual(copy.cook_process, "mix the flour.")
+
+
+if __name__ == "__main__":
+	unittest.main()